@@ -16,5 +16,58 @@ name = proxy.get("name")
 api_id = proxy.get("api_id")
 api_hash = proxy.get("api_hash")
 
+log_file = parser.get("Logging", "file", fallback="")
+log_file = Path(log_file) if log_file else None
+log_file_max_bytes = parser.getint("Logging", "max_bytes", fallback=10 * 1024 * 1024)
+log_file_backups = parser.getint("Logging", "backups", fallback=5)
+
 auto_install_dependencies = parser.getboolean("Addons", "auto_install_dependencies")
 addons_root = Path(parser.get("Addons", "root"))
+addons_wheels_directory = parser.get("Addons", "wheels_dir", fallback="")
+addons_wheels_directory = Path(addons_wheels_directory) if addons_wheels_directory else None
+addons_offline = parser.getboolean("Addons", "offline", fallback=False)
+addons_dependencies_lock = Path(parser.get("Addons", "dependencies_lock", fallback="./.dependencies.lock"))
+addons_index = parser.get("Addons", "index", fallback="./.addons-index.json")
+addons_index = Path(addons_index) if addons_index else None
+addons_hot_reload = parser.getboolean("Addons", "hot_reload", fallback=False)
+addons_hot_reload_interval = parser.getfloat("Addons", "hot_reload_interval", fallback=1.0)
+addons_load_timeout = parser.getfloat("Addons", "load_timeout", fallback=10)
+skip_slow_addons = parser.getboolean("Addons", "skip_slow_addons", fallback=False)
+
+startup_concurrency = parser.getint("Startup", "concurrency", fallback=5)
+startup_connect_timeout = parser.getfloat("Startup", "connect_timeout", fallback=30)
+
+paginator_max_entries = parser.getint("Paginator", "max_entries", fallback=1000)
+paginator_ttl = parser.getfloat("Paginator", "ttl", fallback=86400)
+paginator_prune_interval = parser.getfloat("Paginator", "prune_interval", fallback=300)
+paginator_storage = parser.get("Paginator", "storage", fallback="")
+paginator_storage = Path(paginator_storage) if paginator_storage else None
+
+statistics_storage = parser.get("Statistics", "storage", fallback="")
+statistics_storage = Path(statistics_storage) if statistics_storage else None
+statistics_flush_interval = parser.getfloat("Statistics", "flush_interval", fallback=60)
+
+process_pool_workers = parser.getint("Workers", "processes", fallback=0)
+
+watchdog_enabled = parser.getboolean("Watchdog", "enabled", fallback=False)
+watchdog_threshold = parser.getfloat("Watchdog", "threshold", fallback=0.5)
+watchdog_interval = parser.getfloat("Watchdog", "interval", fallback=0.1)
+
+shards = parser.getint("Sharding", "shards", fallback=1)
+shards_health_interval = parser.getfloat("Sharding", "health_interval", fallback=30)
+
+outbound_rate = parser.getfloat("Outbound", "rate", fallback=20)
+outbound_burst = parser.getint("Outbound", "burst", fallback=30)
+outbound_chat_interval = parser.getfloat("Outbound", "chat_interval", fallback=1.0)
+outbound_in_flight = parser.getint("Outbound", "in_flight", fallback=5)
+outbound_retries = parser.getint("Outbound", "retries", fallback=3)
+outbound_max_flood_wait = parser.getfloat("Outbound", "max_flood_wait", fallback=300)
+outbound_edit_window = parser.getfloat("Outbound", "edit_window", fallback=0.0)
+
+dispatch_addon_concurrency = parser.getint("Dispatch", "addon_concurrency", fallback=10)
+
+intake_max_size = parser.getint("Intake", "max_size", fallback=10000)
+intake_policy = parser.get("Intake", "policy", fallback="drop_oldest")
+intake_concurrency = parser.getint("Intake", "concurrency", fallback=100)
+intake_chat_queue_limit = parser.getint("Intake", "chat_queue_limit", fallback=50)
+intake_max_wait = parser.getfloat("Intake", "max_wait", fallback=30)
@@ -1,4 +1,3 @@
-import importlib
 import re
 from pathlib import Path
 
@@ -10,10 +9,12 @@ from kgemng import CommandManager, EventManager, NewMessageEvent
 from kgemng.command import Command
 
 from core import addons_loader
+from core.sharding import call_all_shards, shard_method
 from core.account_manager import ExtendedClient, Account
 
 import config
-from core.utils import Paginator
+from core.utils import Paginator, PaginatorService
+from core.workers import PROCESS_POOL
 
 
 def get_command_manager():
@@ -31,77 +32,169 @@ command_manager = CommandManager(this_addon, True)
 event_manager = EventManager(this_addon, True)
 
 
-def get_all_included_managers(parent):
-    # Temporary store for managers to check
-    managers: list[CommandManager] = [parent]
-    # Checked managers
-    checked_managers = []
-
-    # Fetching all loaded managers
-    while len(managers):
-        for manager in managers.copy():
-            if not manager:
-                continue
-            checked_managers.append(manager)
-            managers.remove(manager)
-            managers += manager.get_included_managers()
+def get_all_command_managers():
+    return addons_loader.COMMAND_TREE.snapshot().managers
 
-    return checked_managers
 
+def get_all_event_managers():
+    return addons_loader.EVENT_TREE.snapshot().managers
 
-def get_all_command_managers():
-    return get_all_included_managers(command_manager.parent)
 
+@shard_method("accounts_info")
+async def get_accounts_info(account_manager) -> list[str]:
+    def get_account_info(account: Account):
+        full_name = account.info.first_name + (" " + account.info.last_name if account.info.last_name else "")
+        return f"{full_name}(@{account.info.username}:{account.info.id})"
 
-def get_all_event_managers():
-    return get_all_included_managers(event_manager.parent)
+    return await account_manager.async_map(get_account_info)
 
 
-@command_manager.on_command("loaded_accounts", description="Shows loaded accounts")
-async def get_loaded_accounts(client, message):
-    accounts = []
+@shard_method("accounts_usernames")
+async def get_accounts_usernames(account_manager) -> list[str]:
+    def get_account_info(account: Account):
+        return "account " + str(account.info.username)
 
-    async def get_account_info(account, channel: list):
-        channel.append("account " + account.info.username)
+    return await account_manager.async_map(get_account_info)
 
-    await client.account.manager.async_foreach(get_account_info, accounts)
 
-    await message.reply(
-        text="Accounts loaded:\n"
-        + "\n".join(f"- {account}" for account in accounts)
+@command_manager.on_command("loaded_accounts", description="Shows loaded accounts")
+async def get_loaded_accounts(client, message):
+    # Accounts of all shards, when accounts are split between processes
+    accounts = sum(await call_all_shards("accounts_usernames"), [])
+
+    await client.account.send_message(
+        message.chat.id,
+        "Accounts loaded:\n"
+        + "\n".join(f"- {account}" for account in accounts),
+        reply_to_message_id=message.id
     )
 
 
 @command_manager.on_command("bot", owner_only=True, description="Shows bot information")
 async def info(client: ExtendedClient, message: types.Message):
-    accounts = []
-
-    async def get_account_info(account: Account, channel: list):
-        full_name = account.info.first_name + (" " + account.info.last_name if account.info.last_name else "")
-        channel.append(f"{full_name}(@{account.info.username}:{account.info.id})")
+    shards_accounts = await call_all_shards("accounts_info")
+    accounts = sum(shards_accounts, [])
 
-    await client.account.manager.async_foreach(get_account_info, accounts)
-
-    top_used_commands = sorted(
-        command_manager.parent.get_statistic(),
-        key=lambda record: record["call_count"],
-        reverse=True
-    )[:5]
+    statistics = addons_loader.STATISTICS
 
     top_used_commands_text = ', '.join(
-        f"[{' | '.join(record['command'].body)} : {record['call_count']}]" for record in top_used_commands
+        f"[{command} : {call_count}]" for command, call_count in statistics.top_commands(5)
     )
 
-    await message.edit(
+    paginator_services = PaginatorService.get_services()
+    schedulers = [account.outbound for account in client.account.manager.get_accounts()]
+    dispatcher = addons_loader.DISPATCHER
+    intake = addons_loader.INTAKE
+
+    await client.account.edit_message_text(
+        message.chat.id,
+        message.id,
         text="KuyuGenesis userbot:\n"
              f"    Version: {config.version}\n"
              f"    Name: {config.name}\n"
              f"    Owners: {', '.join(accounts)}\n"
+             f"    Shards: {len(shards_accounts)}\n"
              f"    Loaded addons: {len(addons_loader.system.get_enabled_addons())}\n"
              f"    Included command managers: {len(get_all_command_managers())}\n"
              f"    Included event managers: {len(get_all_event_managers())}\n"
-             f"    Total commands call count: {command_manager.parent.get_total_call_count()}\n"
-             f"    Top-5 used commands: {top_used_commands_text}"
+             f"    Total commands call count: {statistics.total}"
+             f" (last hour: {statistics.count_in(statistics.HOUR)}, last day: {statistics.count_in(statistics.DAY)})\n"
+             f"    Top-5 used commands: {top_used_commands_text}\n"
+             f"    Live paginators: {sum(service.live_count for service in paginator_services)}"
+             f" (evicted: {sum(service.evicted_count for service in paginator_services)})\n"
+             f"    Process pool: {PROCESS_POOL.workers} workers, {PROCESS_POOL.pending} pending"
+             f" ({PROCESS_POOL.queued} queued, max {PROCESS_POOL.max_pending}),"
+             f" {PROCESS_POOL.completed} completed, {PROCESS_POOL.failed} failed, {PROCESS_POOL.cancelled} cancelled\n"
+             f"    Outbound requests: {sum(scheduler.queued for scheduler in schedulers)} queued,"
+             f" {sum(scheduler.sent for scheduler in schedulers)} sent,"
+             f" {sum(scheduler.throttled for scheduler in schedulers)} throttled,"
+             f" {sum(scheduler.coalesced for scheduler in schedulers)} edits coalesced,"
+             f" {sum(scheduler.flood_waits for scheduler in schedulers)} flood waits\n"
+             f"    Dispatch: {dispatcher.waiting} waiting for addons, {dispatcher.running} running\n"
+             f"    Intake: {intake.size + intake.handling}/{intake.max_size or 'unlimited'}"
+             f" ({intake.size} queued, {intake.handling} handled, max {intake.max_seen_size}),"
+             f" {intake.shed} shed, {intake.shed_by_account.get(client.account.info.id, 0)} of them for this account,"
+             f" dropped {intake.dropped_overflow} (chat overflow) and {intake.dropped_stale} (stale)"
+    )
+
+
+@command_manager.on_command(
+    "perf",
+    owner_only=True,
+    description="Shows handlers latency percentiles",
+    arguments=("scope(command|event|addon|account)",)
+)
+async def get_performance(client: ExtendedClient, message: types.Message):
+
+    # noinspection PyUnresolvedReferences
+    arguments = message.arguments
+
+    performance = addons_loader.PERFORMANCE
+    scopes = (performance.COMMAND, performance.EVENT, performance.ADDON, performance.ACCOUNT)
+
+    scope = None
+
+    if len(arguments):
+        scope = arguments[0][0].lower()
+
+    if scope is not None and scope not in scopes:
+        return await client.account.edit_message_text(
+            message.chat.id,
+            message.id,
+            message.text + f"\n\nNot allowed scope: {scope}"
+        )
+
+    histograms = sorted(
+        performance.get_histograms(scope).items(),
+        key=lambda item: item[1].percentile(95),
+        reverse=True
+    )
+
+    def format_latency(seconds: float) -> str:
+        return f"{seconds * 1000:.1f}ms"
+
+    paginator = Paginator(event_manager)
+    paginator.header = f"Handlers latency ({scope or 'all'}):"
+    paginator.page_element_prefix = "- "
+
+    await paginator.init(message, client.account, True).make(
+        [
+            f"<b>{key[0]}</b> {key[1]}: {histogram.count} calls, {histogram.errors} errors\n"
+            f"  p50 {format_latency(histogram.percentile(50))}, "
+            f"p95 {format_latency(histogram.percentile(95))}, "
+            f"p99 {format_latency(histogram.percentile(99))}, "
+            f"max {format_latency(histogram.max)}"
+            for key, histogram in histograms
+        ],
+        5
+    )
+
+
+@command_manager.on_command("stalls", owner_only=True, description="Shows handlers that blocked the event loop")
+async def get_stalls(client: ExtendedClient, message: types.Message):
+    detector = addons_loader.STALL_DETECTOR
+
+    if not config.watchdog_enabled:
+        return await client.account.edit_message_text(
+            message.chat.id,
+            message.id,
+            message.text + "\n\nWatchdog is disabled, enable it in [Watchdog] section of config"
+        )
+
+    offenders = "\n".join(
+        f"- <b>{addon}</b> {handler}: {count} stalls, longest {longest * 1000:.0f}ms"
+        for (addon, handler), count, longest in detector.get_offenders(10)
+    )
+
+    await client.account.edit_message_text(
+        message.chat.id,
+        message.id,
+        text="Event loop stalls:\n"
+             f"    Threshold: {detector.threshold * 1000:.0f}ms\n"
+             f"    Stalls: {detector.stalls}\n"
+             f"    Lag: p50 {detector.lag.percentile(50) * 1000:.1f}ms, p99 {detector.lag.percentile(99) * 1000:.1f}ms,"
+             f" max {detector.lag.max * 1000:.0f}ms\n"
+             + (f"Worst offenders:\n{offenders}" if offenders else "")
     )
 
 
@@ -112,7 +205,9 @@ async def get_commands(client: ExtendedClient, message: types.Message):
     arguments = message.arguments
 
     if not len(arguments):
-        return await message.edit(
+        return await client.account.edit_message_text(
+            message.chat.id,
+            message.id,
             message.text + "\n\nPlease, type addon name after the command"
         )
 
@@ -121,13 +216,23 @@ async def get_commands(client: ExtendedClient, message: types.Message):
         if addon_name == "MAIN ADDON":
             addon_command_manager = command_manager
         else:
+            addon = addons_loader.system.get_addon_by_name(addon_name)
+
+            # Lazy addon is imported the same way as on its first command, so on_load runs and managers are included
+            if addon and addon.meta.name in addons_loader.LAZY_ADDONS:
+                await addons_loader.import_lazy_addons(addon)
+
             addon_command_manager = addons_loader.system.get_addon_command_manager(addon_name)
     except ValueError:
-        return await message.edit(
+        return await client.account.edit_message_text(
+            message.chat.id,
+            message.id,
             message.text + "\n\nAddon not found"
         )
     except AttributeError:
-        return await message.edit(
+        return await client.account.edit_message_text(
+            message.chat.id,
+            message.id,
             message.text + "\n\nAddon hasn't command manager"
         )
 
@@ -143,7 +248,7 @@ async def get_commands(client: ExtendedClient, message: types.Message):
 
     paginator = Paginator(event_manager)
     paginator.header = (
-        f"Commands from <b> "
+        "Commands from <b> "
         + (
             addon_command_manager.addon.meta.name
             if addon_command_manager.addon != addon_command_manager.NO_ADDON
@@ -178,7 +283,9 @@ async def get_addons(client: ExtendedClient, message: types.Message):
         status = arguments[0][0].lower()
 
     if status not in ("loaded", "enabled", "disabled", "all"):
-        return await message.edit(
+        return await client.account.edit_message_text(
+            message.chat.id,
+            message.id,
             message.text + f"\n\nNot allowed addon status: {status}"
         )
 
@@ -192,7 +299,9 @@ async def get_addons(client: ExtendedClient, message: types.Message):
         case "all":
             addons = addons_loader.system.get_all_addons()
         case _:
-            return await message.edit(
+            return await client.account.edit_message_text(
+                message.chat.id,
+                message.id,
                 message.text + f"\n\nUnsupported status value: {status}"
             )
 
@@ -216,7 +325,24 @@ async def get_addons(client: ExtendedClient, message: types.Message):
 
 
 def describe_addon(addon: Addon) -> str:
-    if addon.meta.status == "enabled":
+    if addon.meta.name in addons_loader.LAZY_ADDONS:
+        # Module of lazy addon isn't imported until its first use, and mustn't be imported here
+        text = (
+                f"Name: \u200d{addon.meta.name}\u200c\n"
+                f"Status: {addon.meta.status}\n"
+                f"Version: {addon.meta.version}\n"
+                f"Description: {addon.meta.description}\n\n"
+                f"Has command manager: Not imported yet\n"
+                f"Has event manager: Not imported yet\n"
+                f"Dependencies:\n  "
+                + (
+                    "\n  ".join(
+                        f"{lib['name']}=={lib['version']}"
+                        for lib in addon.meta.requirements
+                    ) if addon.meta.requirements else "  Hasn't dependencies"
+                )
+        )
+    elif addon.meta.status == "enabled":
         has_command_manager = hasattr(addon.module, "get_command_manager")
 
         text = (
@@ -255,12 +381,14 @@ def describe_addon(addon: Addon) -> str:
 
 
 @command_manager.on_command("addon", description="Shows information about addon", arguments=("addon name",))
-async def get_addon_info(_: ExtendedClient, message: types.Message):
+async def get_addon_info(client: ExtendedClient, message: types.Message):
     # noinspection PyUnresolvedReferences
     arguments = message.arguments
 
     if not len(arguments):
-        return await message.edit(
+        return await client.account.edit_message_text(
+            message.chat.id,
+            message.id,
             message.text + "\n\nType addon name, to see details"
         )
 
@@ -275,7 +403,7 @@ async def get_addon_info(_: ExtendedClient, message: types.Message):
 
     text += "\n\nType +(to enable addon)/-(to disable addon) in reply to this message"
 
-    await message.edit(text)
+    await client.account.edit_message_text(message.chat.id, message.id, text)
 
 
 addon_name_regexp = re.compile("Name: \u200d(.+)\u200c\n")
@@ -290,22 +418,24 @@ async def toggle_addon(event: NewMessageEvent):
     addon = addons_loader.system.get_addon_by_name(addon_name)
 
     if not addon:
-        return await event.message.edit_text(
+        return await event.account.edit_message_text(
+            event.message.chat.id,
+            event.message.id,
             text=event.message.text + "\n\nAddon not found"
         )
 
     match event.message.text:
         case "+":
-            addons_loader.enable_addon(addon, True)
+            await addons_loader.enable_addon(addon, True)
         case "-":
-            addons_loader.disable_addon(addon)
+            await addons_loader.disable_addon(addon)
 
     text = describe_addon(addon)
 
     text += "\n\nType +(to enable addon)/-(to disable addon) in reply to this message"
 
-    await event.message.reply_to_message.edit(
-        text
+    await event.account.edit_message_text(
+        event.message.chat.id, event.message.reply_to_message.id, text
     )
 
     await event.message.delete()
@@ -1,7 +1,12 @@
+import asyncio
 from inspect import iscoroutinefunction
+from pathlib import Path
 
 from pyrogram import Client, types
 
+import config
+from core.outbound import OutboundScheduler
+
 
 class Account:
 
@@ -12,12 +17,29 @@ class Account:
     def __init__(self, client: Client):
         self._info = None
         self._client = client
+        self._manager = None
+        self._outbound = OutboundScheduler(
+            config.outbound_rate,
+            config.outbound_burst,
+            config.outbound_chat_interval,
+            config.outbound_in_flight,
+            config.outbound_retries,
+            config.outbound_max_flood_wait
+        )
 
     async def resolve_info(self):
+        previous_info = self._info
         self._info = await self._client.get_me()
 
+        if self._manager is not None:
+            self._manager.reindex_account(self, previous_info)
+
         return self._info
 
+    @property
+    def session_name(self) -> str:
+        return Path(self._client.name).name
+
     @property
     def info(self):
         if not self._info:
@@ -28,6 +50,31 @@ class Account:
     def client(self):
         return self._client
 
+    @property
+    def outbound(self) -> OutboundScheduler:
+        return self._outbound
+
+    async def send_message(self, chat_id: int | str, text: str, priority: int | None = None, **kwargs) -> types.Message:
+        return await self._outbound.submit(
+            self._client.send_message, chat_id, text, chat_id=chat_id, priority=priority, **kwargs
+        )
+
+    async def edit_message_text(
+        self, chat_id: int | str, message_id: int, text: str, priority: int | None = None, **kwargs
+    ) -> types.Message:
+        # Edits of the same message queued in a row are merged, so only the latest text is sent
+        return await self._outbound.submit(
+            self._client.edit_message_text,
+            chat_id,
+            message_id,
+            text,
+            chat_id=chat_id,
+            priority=priority,
+            coalesce_key=("edit", chat_id, message_id),
+            delay=config.outbound_edit_window,
+            **kwargs
+        )
+
     @property
     def manager(self):
         return self._manager
@@ -44,9 +91,46 @@ class Account:
 class AccountManager:
 
     _accounts: list[Account]
+    _accounts_by_id: dict[int, Account]
+    _accounts_by_username: dict[str, Account]
+    _accounts_by_session_name: dict[str, Account]
 
     def __init__(self):
         self._accounts = []
+        self._accounts_by_id = {}
+        self._accounts_by_username = {}
+        self._accounts_by_session_name = {}
+
+    def _index_account(self, account: Account):
+        self._accounts_by_session_name[account.session_name] = account
+
+        if account._info is None:
+            return
+
+        self._accounts_by_id[account._info.id] = account
+
+        if account._info.username:
+            self._accounts_by_username[account._info.username.lower()] = account
+
+    def _unindex_account(self, account: Account, info: types.User | None):
+        if self._accounts_by_session_name.get(account.session_name) is account:
+            del self._accounts_by_session_name[account.session_name]
+
+        if info is None:
+            return
+
+        if self._accounts_by_id.get(info.id) is account:
+            del self._accounts_by_id[info.id]
+
+        if info.username and self._accounts_by_username.get(info.username.lower()) is account:
+            del self._accounts_by_username[info.username.lower()]
+
+    def reindex_account(self, account: Account, previous_info: types.User | None = None):
+        if self._accounts_by_session_name.get(account.session_name) is not account:
+            return
+
+        self._unindex_account(account, previous_info)
+        self._index_account(account)
 
     def add_account(self, account: Account | Client):
         if isinstance(account, Client):
@@ -56,11 +140,20 @@ class AccountManager:
             raise ValueError("Cannot operate with type {type} as account".format(type=type(account)))
 
         self._accounts.append(account)
+        self._index_account(account)
         account.manager = self
 
     def pop_account(self, index: int) -> Account | None:
         if len(self._accounts)-1 >= index:
             account = self._accounts.pop(index)
+            self._unindex_account(account, account._info)
+            account.manager = None
+            return account
+
+    def remove_account(self, account: Account) -> Account | None:
+        if account in self._accounts:
+            self._accounts.remove(account)
+            self._unindex_account(account, account._info)
             account.manager = None
             return account
 
@@ -68,6 +161,18 @@ class AccountManager:
         if len(self._accounts)-1 >= index:
             return self._accounts[index]
 
+    def get_account_by_id(self, user_id: int) -> Account | None:
+        return self._accounts_by_id.get(user_id)
+
+    def get_account_by_username(self, username: str) -> Account | None:
+        return self._accounts_by_username.get(username.lstrip("@").lower())
+
+    def get_account_by_session_name(self, session_name: str) -> Account | None:
+        return self._accounts_by_session_name.get(session_name)
+
+    def has_account_id(self, user_id: int) -> bool:
+        return user_id in self._accounts_by_id
+
     def get_accounts(self):
         return self._accounts.copy()
 
@@ -84,6 +189,56 @@ class AccountManager:
             if iscoro:
                 await result
 
+    async def async_map(
+        self,
+        callback,
+        *args,
+        concurrency: int | None = None,
+        timeout: float | None = None,
+        fail_fast: bool = True,
+        **kwargs
+    ) -> list:
+        accounts = self._accounts.copy()
+        semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+        async def call(account: Account):
+            result = callback(account, *args, **kwargs)
+
+            if not iscoroutinefunction(callback):
+                return result
+
+            if semaphore is None:
+                return await asyncio.wait_for(result, timeout)
+
+            async with semaphore:
+                return await asyncio.wait_for(result, timeout)
+
+        tasks = [asyncio.ensure_future(call(account)) for account in accounts]
+
+        if not len(tasks):
+            return []
+
+        if not fail_fast:
+            return list(await asyncio.gather(*tasks, return_exceptions=True))
+
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        for task in pending:
+            task.cancel()
+
+        # Results are returned in accounts order, so the first failed account is reported
+        errors = [task.exception() for task in tasks if task in done and task.exception() is not None]
+
+        if len(errors):
+            raise errors[0]
+
+        return [task.result() for task in tasks]
+
 
 class ExtendedClient(Client):
     account: Account
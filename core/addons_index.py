@@ -0,0 +1,170 @@
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+from RelativeAddonsSystem import Addon, AddonMeta
+from colorama import Fore
+
+from core.logs import get_logger, wrap_into_color
+
+logger = get_logger("AddonsIndex")
+
+REQUIRED_FIELDS = ("name", "description", "version", "author")
+
+
+class IndexedAddonMeta(AddonMeta):
+    # Metadata taken from discovery index instead of reading manifest again
+
+    def __init__(self, path: Path, info: dict[str, Any]):
+        self._path = path
+        self._keys = list(info.keys())
+
+        for name, value in info.items():
+            setattr(self, name, value)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {name: self[name] for name in self._keys}
+
+
+class IndexedAddon(Addon):
+    def __init__(self, path: Path, info: dict[str, Any]):
+        self._meta = IndexedAddonMeta(path / "addon.json", info)
+        self.path = path.absolute()
+        self._module = None
+        self._storage = None
+
+        self._module_path = self.path.relative_to(Path().absolute())
+        self._config_path = self.path / (self.meta.name + "-storage.json")
+
+    def update_meta(self, info: dict[str, Any]):
+        self._meta = IndexedAddonMeta(self.path / "addon.json", info)
+
+
+def manifest_signature(path: str) -> list[int] | None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class AddonsIndex:
+    # Manifests metadata keyed by addon directory with mtime and size of manifest,
+    # only manifests that changed since they were indexed are parsed again
+
+    def __init__(self, path: Path | None = None):
+        self.path = path
+
+        self._entries: dict[str, dict[str, Any]] = self._read()
+        self._addons: dict[str, IndexedAddon] = {}
+
+    def _read(self) -> dict[str, dict[str, Any]]:
+        if self.path is None or not self.path.exists():
+            return {}
+
+        try:
+            return json.loads(self.path.read_text(encoding="utf8"))
+        except ValueError:
+            return {}
+
+    def save(self):
+        if self.path is None:
+            return
+
+        # Written to temporary file and moved over the index, so shards never read partially written index
+        temporary_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        temporary_path.write_text(json.dumps(self._entries, ensure_ascii=False), encoding="utf8")
+        os.replace(temporary_path, self.path)
+
+    def _parse(self, directory: os.DirEntry, signature: list[int]) -> dict[str, Any] | None:
+        try:
+            with open(os.path.join(directory.path, "addon.json"), encoding="utf8") as manifest:
+                info = json.load(manifest)
+        except (OSError, ValueError) as e:
+            logger.warning(
+                "Cannot read manifest of addon at [ {path} ] -> ".format(
+                    path=wrap_into_color(directory.path, color=Fore.YELLOW)
+                )
+                + wrap_into_color(repr(e), color=Fore.RED)
+            )
+            return None
+
+        valid = isinstance(info, dict) and all(field in info for field in REQUIRED_FIELDS)
+
+        if not valid:
+            logger.warning(
+                "Addon at [ {path} ] does not have required fields: {fields}".format(
+                    path=wrap_into_color(directory.path, color=Fore.YELLOW),
+                    fields="/".join(REQUIRED_FIELDS)
+                )
+            )
+
+        return {"signature": signature, "meta": info if valid else {}, "valid": valid}
+
+    def _addon(self, directory: os.DirEntry, entry: dict[str, Any]) -> IndexedAddon:
+        addon = self._addons.get(directory.name)
+
+        # Addon objects are kept between scans, so loaded addons stay the same objects after manifest changes
+        if addon is None:
+            addon = self._addons[directory.name] = IndexedAddon(Path(directory.path), entry["meta"])
+        elif addon.meta.to_dict() != entry["meta"]:
+            addon.update_meta(entry["meta"])
+
+        return addon
+
+    def scan(self, root: Path) -> list[IndexedAddon]:
+        addons = []
+        directories = set()
+        changed = False
+
+        for directory in os.scandir(root):
+            if not directory.is_dir() or not os.path.exists(os.path.join(directory.path, "__init__.py")):
+                continue
+
+            signature = manifest_signature(os.path.join(directory.path, "addon.json"))
+
+            if signature is None:
+                continue
+
+            directories.add(directory.name)
+            entry = self._entries.get(directory.name)
+
+            if entry is None or entry["signature"] != signature:
+                entry = self._parse(directory, signature)
+
+                if entry is None:
+                    continue
+
+                self._entries[directory.name] = entry
+                changed = True
+
+            if not entry["valid"]:
+                continue
+
+            addon = self._addon(directory, entry)
+
+            if "status" not in addon.meta or "requirements" not in addon.meta:
+                if "status" not in addon.meta:
+                    addon.meta["status"] = "disabled"
+
+                if "requirements" not in addon.meta:
+                    addon.meta["requirements"] = []
+
+                addon.meta.save()
+
+                entry["meta"] = addon.meta.to_dict()
+                entry["signature"] = manifest_signature(os.path.join(directory.path, "addon.json"))
+
+            addons.append(addon)
+
+        for name in set(self._entries) - directories:
+            del self._entries[name]
+            self._addons.pop(name, None)
+            changed = True
+
+        if changed:
+            self.save()
+
+        return addons
@@ -1,19 +1,42 @@
+import asyncio
 import builtins
+import importlib
+import inspect
 import logging
+import sys
+import time
 from pathlib import Path
+from types import ModuleType
+from typing import Callable
 
 from RelativeAddonsSystem import Addon
 from colorama import Fore
+from pyrogram import ContinuePropagation
 
 import config
+from core.addons_watcher import AddonsWatcher
+from core.command_index import CommandIndex, command_bodies, command_runs, declared_command_heads
 from core.custom_addons_system import CustomRelativeAddonsSystem
+from core.dispatch import DispatchExecutor, update_chat_id
+from core import intake
 from kgemng import CommandManager, EventManager
 from core.logs import get_logger, wrap_into_color
+from core import outbound
+from core.manager_tree import ManagerTree, manager_addon_name
+from core.perf import PerformanceMonitor
+from core.statistics import CommandStatistics
+from core.update_router import UpdateRouter
+from core.watchdog import StallDetector
 
 logger = get_logger("AddonLoader", logging.INFO)
 
 system = CustomRelativeAddonsSystem(
-    config.addons_root, config.auto_install_dependencies
+    config.addons_root,
+    config.auto_install_dependencies,
+    config.addons_wheels_directory,
+    config.addons_offline,
+    config.addons_dependencies_lock,
+    config.addons_index
 )
 
 MAIN_COMMAND_MANAGER: CommandManager | None = None
@@ -21,25 +44,349 @@ MAIN_EVENT_MANAGER: EventManager | None = None
 
 LOADED_ADDONS: set[Addon] = set()
 
+# Addons that declared their commands and update types in manifest, and will be imported on first use
+LAZY_ADDONS: dict[str, Addon] = {}
+LAZY_IMPORTS: dict[str, asyncio.Future] = {}
+
+# on_load hooks that exceeded load budget, but weren't cancelled
+SLOW_LOADS: set[asyncio.Future] = set()
+
+COMMAND_TREE = ManagerTree()
+EVENT_TREE = ManagerTree()
+
+COMMAND_INDEX = CommandIndex()
+
+STATISTICS = CommandStatistics()
+
+PERFORMANCE = PerformanceMonitor()
+
+UPDATE_ROUTER = UpdateRouter()
+
+INTAKE = intake.IntakeQueue(
+    config.intake_max_size,
+    config.intake_policy,
+    config.intake_concurrency,
+    config.intake_chat_queue_limit,
+    config.intake_max_wait
+)
+
+DISPATCHER = DispatchExecutor(config.dispatch_addon_concurrency)
+
+STALL_DETECTOR = StallDetector(
+    lambda: [*LOADED_ADDONS, *([system.get_main_addon()] if system.get_main_addon() else [])],
+    config.watchdog_threshold,
+    config.watchdog_interval
+)
+
+# Cleanups of state bound to manager (paginators and so on), called when manager is dropped by reload
+MANAGER_FINALIZERS: dict[int, list[Callable[[], None]]] = {}
+
+# Called with addon and its event manager every time event manager is included: on load, lazy import and reload
+EVENT_MANAGER_HOOKS: list[Callable[[Addon, EventManager], None]] = []
+
 
 def init(main_command_manager: CommandManager, main_event_manager: EventManager):
     global MAIN_COMMAND_MANAGER, MAIN_EVENT_MANAGER
     MAIN_COMMAND_MANAGER = main_command_manager
     MAIN_EVENT_MANAGER = main_event_manager
 
+    COMMAND_TREE.root = main_command_manager
+    EVENT_TREE.root = main_event_manager
+
+    rebuild_command_index()
+
+
+def rebuild_command_index():
+    COMMAND_INDEX.build(COMMAND_TREE.snapshot().managers)
+
+
+def attach_manager(parent: CommandManager | EventManager, manager: CommandManager | EventManager):
+    parent.include_manager(manager)
+    tree_changed(manager)
+
+
+def detach_manager(parent: CommandManager | EventManager, manager: CommandManager | EventManager):
+    parent.exclude_manager(manager)
+    tree_changed(manager)
+
+
+def add_manager_finalizer(manager: CommandManager | EventManager, finalizer: Callable[[], None]):
+    MANAGER_FINALIZERS.setdefault(id(manager), []).append(finalizer)
+
+
+def finalize_manager(manager: CommandManager | EventManager):
+    for finalizer in MANAGER_FINALIZERS.pop(id(manager), []):
+        try:
+            finalizer()
+        except Exception as e:
+            logger.warning("Error while finalizing manager -> " + wrap_into_color(repr(e), color=Fore.RED))
+
+
+def add_event_manager_hook(hook: Callable[[Addon, EventManager], None]):
+    EVENT_MANAGER_HOOKS.append(hook)
+
+
+def run_event_manager_hooks(addon: Addon, event_manager: EventManager):
+    for hook in EVENT_MANAGER_HOOKS:
+        try:
+            hook(addon, event_manager)
+        except Exception as e:
+            logger.warning(
+                "Error in event manager hook of addon [ {addon_name} ] -> ".format(
+                    addon_name=wrap_into_color(addon.meta.name, color=Fore.YELLOW)
+                )
+                + wrap_into_color(repr(e), color=Fore.RED)
+            )
+
+
+def tree_changed(manager: CommandManager | EventManager):
+    if isinstance(manager, CommandManager):
+        COMMAND_TREE.invalidate()
+        rebuild_command_index()
+    else:
+        EVENT_TREE.invalidate()
+
+
+async def execute_command(client, message):
+    # Text that isn't a command, or command that managers won't run, is passed to raw update handlers here:
+    # handlers run in own tasks, so ContinuePropagation raised by managers doesn't reach Pyrogram
+    if not any(
+        command_runs(command, message.text, message.outgoing) for command, _ in COMMAND_INDEX.match(message.text)
+    ) and not len(COMMAND_INDEX.match_lazy(message.text)):
+        raise ContinuePropagation
+
+    # Updates can come before Account.resolve_info(), client.me is set before Pyrogram starts dispatching them
+    account_id = client.me.id
+
+    # Commands of owner are never dropped by overloaded chat
+    INTAKE.put(
+        intake.OWNER_COMMAND if message.outgoing else intake.MESSAGE,
+        account_id,
+        (account_id, message.chat.id),
+        lambda: dispatch_command(client, message),
+        droppable=not message.outgoing
+    )
+
+
+async def execute_event(client, update, users, chats):
+    # Updates no one of included event managers subscribed to are dropped
+    if not UPDATE_ROUTER.route(update):
+        return
+
+    account_id = client.me.id
+    chat_id = update_chat_id(update)
+    outgoing = bool(getattr(getattr(update, "message", None), "out", False))
+
+    INTAKE.put(
+        intake.update_priority(update),
+        account_id,
+        (account_id, chat_id) if chat_id is not None else None,
+        lambda: dispatch_event(client, update, users, chats),
+        droppable=not outgoing
+    )
+
+
+async def dispatch_command(client, message):
+    lazy_addons = COMMAND_INDEX.match_lazy(message.text)
+
+    if len(lazy_addons):
+        await import_lazy_addons(*lazy_addons)
+
+    commands = COMMAND_INDEX.match(message.text)
+
+    if not len(commands):
+        return
+
+    account_id = client.me.id
+    perf_keys = [(PERFORMANCE.ACCOUNT, account_id)]
+    addons_names = []
+
+    for command, manager in commands:
+        perf_keys += [
+            (PERFORMANCE.COMMAND, command_bodies(command)[0]), (PERFORMANCE.ADDON, manager_addon_name(manager))
+        ]
+        addons_names.append(manager_addon_name(manager))
+
+    async def execute():
+        # Replies and edits of owner commands are sent before other queued requests of account
+        priority = outbound.current_priority.set(outbound.HIGH if message.outgoing else outbound.NORMAL)
+
+        try:
+            with PERFORMANCE.measure(*dict.fromkeys(perf_keys)):
+                await MAIN_COMMAND_MANAGER.execute(client, message)
+        finally:
+            outbound.current_priority.reset(priority)
+
+        # Recorded once per message and only after it was executed, so dropped updates and
+        # commands that managers skip aren't counted
+        for command, manager in commands:
+            if command_runs(command, message.text, message.outgoing):
+                STATISTICS.record(command_bodies(command)[0], manager_addon_name(manager), account_id)
+                break
 
-def load_main_addon():
+    await DISPATCHER.run(addons_names, execute)
+
+
+async def dispatch_event(client, update, users, chats):
+    lazy_addons = UPDATE_ROUTER.get_lazy_addons(update)
+
+    if len(lazy_addons):
+        await import_lazy_addons(*lazy_addons)
+
+    account_id = client.me.id
+    addons_names = [manager_addon_name(manager) for manager in UPDATE_ROUTER.get_managers(update)]
+
+    async def execute():
+        # Event managers of addons are measured by themselves, see measure_event_manager()
+        with PERFORMANCE.measure((PERFORMANCE.ACCOUNT, account_id)):
+            await MAIN_EVENT_MANAGER.execute(client, update, users, chats)
+
+    await DISPATCHER.run(addons_names, execute)
+
+
+def measure_event_manager(addon: Addon, event_manager: EventManager):
+    # Root event manager runs every included manager, so latency of each addon is measured around its own manager
+    if getattr(event_manager, "_measured", False):
+        return
+
+    execute = event_manager.execute
+
+    async def measured_execute(client, update, *args, **kwargs):
+        with PERFORMANCE.measure(
+            (PERFORMANCE.EVENT, f"{addon.meta.name}:{type(update).__name__}"), (PERFORMANCE.ADDON, addon.meta.name)
+        ):
+            return await execute(client, update, *args, **kwargs)
+
+    event_manager.execute = measured_execute
+    event_manager._measured = True
+
+
+add_event_manager_hook(measure_event_manager)
+
+
+def subscribe_events(addon: Addon, event_manager: EventManager):
+    try:
+        UPDATE_ROUTER.subscribe(event_manager, system.get_addon_update_types(addon))
+    except ValueError as e:
+        logger.warning(
+            "Invalid update types of addon [ {addon_name} ], it will receive all updates -> ".format(
+                addon_name=wrap_into_color(addon.meta.name, color=Fore.YELLOW)
+            )
+            + wrap_into_color(e.args[0], color=Fore.RED)
+        )
+        UPDATE_ROUTER.subscribe(event_manager)
+
+
+def register_lazy_addon(addon: Addon) -> bool:
+    try:
+        commands, prefixes = system.get_addon_declared_commands(addon)
+        update_types = system.get_addon_update_types(addon)
+
+        if not len(commands) and not update_types:
+            raise ValueError("Lazy addon must declare commands or update types")
+
+        if update_types:
+            UPDATE_ROUTER.subscribe_lazy(addon, update_types)
+    except ValueError as e:
+        logger.warning(
+            "Cannot load addon [ {addon_name} ] lazily, it will be imported now -> ".format(
+                addon_name=wrap_into_color(addon.meta.name, color=Fore.YELLOW)
+            )
+            + wrap_into_color(e.args[0], color=Fore.RED)
+        )
+        return False
+
+    COMMAND_INDEX.add_lazy(addon, declared_command_heads(commands, prefixes))
+    LAZY_ADDONS[addon.meta.name] = addon
+
+    logger.info(
+        "Addon [ {addon_name} ] will be imported on first use".format(
+            addon_name=wrap_into_color(addon.meta.name, color=Fore.YELLOW)
+        )
+    )
+
+    return True
+
+
+def unregister_lazy_addon(addon: Addon) -> bool:
+    if LAZY_ADDONS.pop(addon.meta.name, None) is None:
+        return False
+
+    COMMAND_INDEX.remove_lazy(addon)
+    UPDATE_ROUTER.unsubscribe_lazy(addon)
+
+    return True
+
+
+async def import_lazy_addons(*addons: Addon):
+    tasks = []
+
+    for addon in addons:
+        task = LAZY_IMPORTS.get(addon.meta.name)
+
+        # Stubs are kept until addon is loaded, so updates that came during import wait for the same task
+        if task is None:
+            task = LAZY_IMPORTS[addon.meta.name] = asyncio.ensure_future(import_lazy_addon(addon))
+
+        tasks.append(task)
+
+    await asyncio.gather(*(asyncio.shield(task) for task in tasks))
+
+
+async def import_lazy_addon(addon: Addon):
+    try:
+        await load_addons(addon, lazy=False)
+    finally:
+        unregister_lazy_addon(addon)
+        LAZY_IMPORTS.pop(addon.meta.name, None)
+
+
+async def run_system_event(addon: Addon, event: str, timeout: float | None = None):
+    try:
+        handler = system.get_addon_system_event_handler(addon, event)
+    except AttributeError:
+        return
+
+    result = handler()
+
+    if inspect.isawaitable(result):
+        await asyncio.wait_for(result, timeout)
+
+
+def slow_load_done(addon: Addon, future: asyncio.Future):
+    SLOW_LOADS.discard(future)
+
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning(
+            "Error in on_load of addon [ {addon_name} ] after load budget exceeded -> ".format(
+                addon_name=wrap_into_color(addon.meta.name, color=Fore.YELLOW)
+            )
+            + wrap_into_color(repr(future.exception()), color=Fore.RED)
+        )
+        return
+
+    logger.info(
+        "Addon [ {addon_name} ] finished on_load after load budget exceeded".format(
+            addon_name=wrap_into_color(addon.meta.name, color=Fore.YELLOW)
+        )
+    )
+
+
+async def load_main_addon():
     addon = Addon(Path(__file__).parent / "MainAddon")
 
-    load_addons(addon)
+    await load_addons(addon)
 
 
-def load_addons(
-    *addons_names: str | Addon
+async def load_addons(
+    *addons_names: str | Addon,
+    lazy: bool = True
 ):
     if not len(addons_names):
         return
 
+    addons = []
+
     for addon_name in addons_names:
         addon = system.get_addon_by_name(addon_name)
 
@@ -59,22 +406,90 @@ def load_addons(
             )
             continue
 
+        if addon.meta.name in system.addon_with_requirements_problem:
+            logger.warning(
+                "Cannot load addon with unsatisfied requirements [ {addon_name} ]".format(
+                    addon_name=wrap_into_color(addon.meta.name, color=Fore.YELLOW)
+                )
+            )
+            continue
+
+        if lazy and system.is_lazy_addon(addon) and register_lazy_addon(addon):
+            continue
+
+        addons.append(addon)
+
+    if not len(addons):
+        return
+
+    # Modules are imported one by one, because builtins.this must point to the importing addon
+    import_times = {}
+
+    for addon in addons:
+        started_at = time.perf_counter()
+
         setattr(builtins, "this", addon)
-        addon.module.this = addon
-        delattr(builtins, "this")
+        try:
+            addon.module.this = addon
+        finally:
+            delattr(builtins, "this")
+
+        import_times[addon.meta.name] = time.perf_counter() - started_at
 
+    load_times = {}
+
+    async def load(addon: Addon):
+        started_at = time.perf_counter()
         try:
-            system.get_addon_system_event_handler(addon, "load")()
-        except AttributeError:
-            pass
+            await run_system_event(addon, "load")
+        finally:
+            load_times[addon.meta.name] = time.perf_counter() - started_at
+
+    tasks = {asyncio.ensure_future(load(addon)): addon for addon in addons}
+
+    done, pending = await asyncio.wait(tasks.keys(), timeout=config.addons_load_timeout or None)
+
+    report = []
+
+    for task, addon in tasks.items():
+        name = addon.meta.name
+        import_time = f"{import_times[name] * 1000:.0f}ms"
+
+        if task in pending:
+            if config.skip_slow_addons:
+                task.cancel()
+                report.append((name, import_time, "-", wrap_into_color("skipped: load budget exceeded", color=Fore.RED)))
+                continue
+
+            SLOW_LOADS.add(task)
+            task.add_done_callback(lambda future, slow_addon=addon: slow_load_done(slow_addon, future))
+            report.append((name, import_time, "-", wrap_into_color("load budget exceeded", color=Fore.YELLOW)))
+        elif task.exception() is not None:
+            report.append((name, import_time, "-", wrap_into_color(f"failed: {task.exception()!r}", color=Fore.RED)))
+            continue
+        else:
+            report.append((name, import_time, f"{load_times[name] * 1000:.0f}ms", "loaded"))
 
         LOADED_ADDONS.add(addon)
 
         include_events(addon)
         include_commands(addon)
 
+    logger.info(
+        "Addons load report:\n    "
+        + "\n    ".join(
+            "{name}: import {import_time}, on_load {load_time}, {status}".format(
+                name=wrap_into_color(name, color=Fore.YELLOW),
+                import_time=import_time,
+                load_time=load_time,
+                status=status
+            )
+            for name, import_time, load_time, status in report
+        )
+    )
+
 
-def unload_addons(*addons_names: str | Addon):
+async def unload_addons(*addons_names: str | Addon):
     if not len(addons_names):
         return
 
@@ -97,6 +512,9 @@ def unload_addons(*addons_names: str | Addon):
             )
             continue
 
+        if unregister_lazy_addon(addon):
+            continue
+
         if addon not in LOADED_ADDONS:
             logger.warning(
                 "Cannot unload not loaded addon [ {addon_name} ]".format(
@@ -104,10 +522,7 @@ def unload_addons(*addons_names: str | Addon):
                 )
             )
 
-        try:
-            system.get_addon_system_event_handler(addon, "unload")()
-        except AttributeError:
-            pass
+        await run_system_event(addon, "unload", config.addons_load_timeout or None)
 
         LOADED_ADDONS.remove(addon)
 
@@ -157,7 +572,9 @@ def include_events(*addons_names: str | Addon):
         if not MAIN_EVENT_MANAGER:
             logging.critical("Loader doesn't initiated")
 
-        MAIN_EVENT_MANAGER.include_manager(event_manager)
+        attach_manager(MAIN_EVENT_MANAGER, event_manager)
+        subscribe_events(addon, event_manager)
+        run_event_manager_hooks(addon, event_manager)
         logger.info(
             "Included event manager from addon [ {addon_name} ]".format(
                 addon_name=wrap_into_color(addon.meta.name, color=Fore.YELLOW)
@@ -208,7 +625,8 @@ def exclude_events(*addons_names: str | Addon):
         if not MAIN_EVENT_MANAGER:
             logging.critical("Loader doesn't initiated")
 
-        MAIN_EVENT_MANAGER.exclude_manager(event_manager)
+        detach_manager(MAIN_EVENT_MANAGER, event_manager)
+        UPDATE_ROUTER.unsubscribe(event_manager)
         logger.info(
             "Excluded event manager from addon [ {addon_name} ]".format(
                 addon_name=wrap_into_color(addon.meta.name, color=Fore.YELLOW)
@@ -253,18 +671,21 @@ def include_commands(*addons_names: str | Addon):
                 )
                 + wrap_into_color(e.args[0], color=Fore.RED)
             )
-            return
+            continue
 
         if not MAIN_COMMAND_MANAGER:
             logging.critical("Loader doesn't initiated")
 
         MAIN_COMMAND_MANAGER.include_manager(addon_command_manager)
+        COMMAND_TREE.invalidate()
         logger.info(
             "Included command manager from addon [ {name} ]".format(
                 name=wrap_into_color(addon.meta.name, color=Fore.YELLOW)
             )
         )
 
+    rebuild_command_index()
+
 
 def exclude_commands(*addons_names: str | Addon):
     addons = []
@@ -304,20 +725,23 @@ def exclude_commands(*addons_names: str | Addon):
                 )
                 + wrap_into_color(e.args[0], color=Fore.RED)
             )
-            return
+            continue
 
         if not MAIN_COMMAND_MANAGER:
             logging.critical("Loader doesn't initiated")
 
         MAIN_COMMAND_MANAGER.exclude_manager(addon_command_manager)
+        COMMAND_TREE.invalidate()
         logger.info(
             "Excluded command manager from addon [ {name} ]".format(
                 name=wrap_into_color(addon.meta.name, color=Fore.YELLOW)
             )
         )
 
+    rebuild_command_index()
 
-def enable_addon(addon_name: str | Addon, load_managers: bool = False):
+
+async def enable_addon(addon_name: str | Addon, load_managers: bool = False):
     addon = system.get_addon_by_name(addon_name)
 
     if not addon:
@@ -325,11 +749,9 @@ def enable_addon(addon_name: str | Addon, load_managers: bool = False):
         return
 
     addon.enable()
+    system.invalidate_addon(addon)
 
-    try:
-        system.get_addon_system_event_handler(addon, "enable")()
-    except AttributeError:
-        pass
+    await run_system_event(addon, "enable", config.addons_load_timeout or None)
 
     if load_managers:
         include_commands(addon)
@@ -338,22 +760,194 @@ def enable_addon(addon_name: str | Addon, load_managers: bool = False):
     return True
 
 
-def disable_addon(addon_name: str | Addon, unload_managers: bool = True):
+async def disable_addon(addon_name: str | Addon, unload_managers: bool = True):
     addon = system.get_addon_by_name(addon_name)
 
     if not addon:
         logger.warning("Addon [ {addon_name} ] not found".format(addon_name=addon_name))
         return
 
-    try:
-        system.get_addon_system_event_handler(addon, "disable")()
-    except AttributeError:
-        pass
+    if unregister_lazy_addon(addon):
+        addon.disable()
+        system.invalidate_addon(addon)
+        return True
+
+    await run_system_event(addon, "disable", config.addons_load_timeout or None)
 
     if unload_managers:
         exclude_commands(addon)
         exclude_events(addon)
 
     addon.disable()
+    system.invalidate_addon(addon)
+
+    return True
+
+
+def get_loaded_addon(addon_name: str | Addon | Path) -> Addon | None:
+    for addon in LOADED_ADDONS:
+        if addon is addon_name or addon.meta.name == addon_name or addon.path == addon_name:
+            return addon
+
+    return None
+
+
+def addon_modules(addon: Addon) -> dict[str, ModuleType]:
+    # Only modules from addon directory are reloaded, modules it imported from core and libraries are shared
+    path = addon.path.resolve()
+    modules = {}
+
+    for name, module in list(sys.modules.items()):
+        file = getattr(module, "__file__", None)
+
+        if file and Path(file).resolve().is_relative_to(path):
+            modules[name] = module
+
+    return modules
+
+
+def import_addon_module(addon: Addon, module_name: str) -> dict[str, ModuleType]:
+    # New version is imported into new module objects, so the loaded version isn't touched until it is replaced.
+    # Returns modules of previous version
+    previous_modules = addon_modules(addon)
+
+    for name in previous_modules:
+        del sys.modules[name]
+
+    setattr(builtins, "this", addon)
+    try:
+        importlib.import_module(module_name).this = addon
+    except BaseException:
+        restore_addon_modules(addon, previous_modules)
+        raise
+    finally:
+        delattr(builtins, "this")
+
+    return previous_modules
+
+
+def restore_addon_modules(addon: Addon, modules: dict[str, ModuleType]):
+    for name in addon_modules(addon):
+        del sys.modules[name]
+
+    sys.modules.update(modules)
+
+
+async def reload_addon(addon_name: str | Addon | Path) -> bool:
+    addon = get_loaded_addon(addon_name)
+
+    if not addon:
+        # Lazy and not loaded addons will import current sources when they are loaded
+        return False
+
+    def optional(getter: Callable, *args):
+        try:
+            return getter(*args)
+        except AttributeError:
+            return None
+
+    old_module = addon.module
+    old_command_manager = optional(system.get_addon_command_manager, addon)
+    old_event_manager = optional(system.get_addon_event_manager, addon)
+
+    started_at = time.perf_counter()
+
+    try:
+        previous_modules = import_addon_module(addon, old_module.__name__)
+    except Exception as e:
+        logger.warning(
+            "Error while importing new version of addon [ {addon_name} ], previous version is kept -> ".format(
+                addon_name=wrap_into_color(addon.meta.name, color=Fore.YELLOW)
+            )
+            + wrap_into_color(repr(e), color=Fore.RED)
+        )
+        return False
+
+    # Previous version releases its resources before new one acquires them
+    try:
+        await run_system_event(addon, "unload", config.addons_load_timeout or None)
+    except Exception as e:
+        logger.warning(
+            "Error in on_unload of previous version of addon [ {addon_name} ] -> ".format(
+                addon_name=wrap_into_color(addon.meta.name, color=Fore.YELLOW)
+            )
+            + wrap_into_color(repr(e), color=Fore.RED)
+        )
+
+    addon.module = sys.modules[old_module.__name__]
+
+    try:
+        await run_system_event(addon, "load", config.addons_load_timeout or None)
+    except Exception as e:
+        logger.warning(
+            "Error in on_load of new version of addon [ {addon_name} ], previous version is restored -> ".format(
+                addon_name=wrap_into_color(addon.meta.name, color=Fore.YELLOW)
+            )
+            + wrap_into_color(repr(e), color=Fore.RED)
+        )
+
+        restore_addon_modules(addon, previous_modules)
+        addon.module = old_module
+
+        try:
+            await run_system_event(addon, "load", config.addons_load_timeout or None)
+        except Exception as e:
+            logger.warning(
+                "Error in on_load of previous version of addon [ {addon_name} ] -> ".format(
+                    addon_name=wrap_into_color(addon.meta.name, color=Fore.YELLOW)
+                )
+                + wrap_into_color(repr(e), color=Fore.RED)
+            )
+
+        return False
+
+    # Old managers are replaced without awaiting in between, so no update sees addon half-swapped
+    system.invalidate_addon(addon)
+
+    if old_event_manager is not None:
+        old_event_manager.disable()
+        detach_manager(MAIN_EVENT_MANAGER, old_event_manager)
+        UPDATE_ROUTER.unsubscribe(old_event_manager)
+
+    if old_command_manager is not None:
+        old_command_manager.disable()
+        MAIN_COMMAND_MANAGER.exclude_manager(old_command_manager)
+        COMMAND_TREE.invalidate()
+
+    include_events(addon)
+    include_commands(addon)
+
+    for manager in (old_event_manager, old_command_manager):
+        if manager is not None:
+            finalize_manager(manager)
+
+    logger.info(
+        "Addon [ {addon_name} ] reloaded in {time}".format(
+            addon_name=wrap_into_color(addon.meta.name, color=Fore.YELLOW),
+            time=f"{(time.perf_counter() - started_at) * 1000:.0f}ms"
+        )
+    )
 
     return True
+
+
+async def watch_addons(interval: float = 1.0):
+    watcher = AddonsWatcher(system.directory, interval)
+
+    logger.info(
+        "Watching addons sources in [ {root} ] for changes".format(
+            root=wrap_into_color(str(watcher.root), color=Fore.YELLOW)
+        )
+    )
+
+    async for directories in watcher.changes():
+        for directory in directories:
+            try:
+                await reload_addon(directory)
+            except Exception as e:
+                logger.warning(
+                    "Error while reloading addon from [ {directory} ] -> ".format(
+                        directory=wrap_into_color(str(directory), color=Fore.YELLOW)
+                    )
+                    + wrap_into_color(repr(e), color=Fore.RED)
+                )
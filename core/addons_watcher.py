@@ -0,0 +1,94 @@
+import asyncio
+import os
+from pathlib import Path
+from typing import AsyncIterator
+
+try:
+    from watchfiles import awatch, PythonFilter
+except ImportError:
+    # Without watchfiles (inotify and other native backends) sources are polled by mtime
+    awatch = PythonFilter = None
+
+
+def addon_sources_state(directory: str | Path) -> dict[str, tuple[int, int]]:
+    state = {}
+
+    for root, directories, files in os.walk(directory):
+        directories[:] = [name for name in directories if name != "__pycache__"]
+
+        for file in files:
+            if not file.endswith(".py"):
+                continue
+
+            path = os.path.join(root, file)
+
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            state[path] = (stat.st_mtime_ns, stat.st_size)
+
+    return state
+
+
+class AddonsWatcher:
+    # Yields directories of addons which python sources were changed
+
+    def __init__(self, root: str | Path, interval: float = 1.0, debounce: float = 0.5):
+        self.root = Path(root).absolute()
+        self.interval = interval
+        self.debounce = debounce
+
+    def addon_directory(self, path: str | Path) -> Path | None:
+        try:
+            parts = Path(path).resolve().relative_to(self.root.resolve()).parts
+        except ValueError:
+            return None
+
+        if len(parts) < 2:
+            return None
+
+        return self.root / parts[0]
+
+    def poll(self) -> dict[str, dict[str, tuple[int, int]]]:
+        return {
+            entry.name: addon_sources_state(entry.path)
+            for entry in os.scandir(self.root)
+            if entry.is_dir()
+        }
+
+    async def changes(self) -> AsyncIterator[set[Path]]:
+        if awatch is not None:
+            async for changes in awatch(self.root, watch_filter=PythonFilter(), debounce=int(self.debounce * 1000)):
+                directories = {self.addon_directory(path) for _, path in changes} - {None}
+
+                if len(directories):
+                    yield directories
+
+            return
+
+        state = await asyncio.to_thread(self.poll)
+
+        while True:
+            await asyncio.sleep(self.interval)
+
+            changed = set()
+
+            # Changes are collected until sources stop changing, so half-saved files aren't imported
+            while True:
+                new_state = await asyncio.to_thread(self.poll)
+                changed_now = {
+                    name for name in new_state.keys() | state.keys()
+                    if new_state.get(name) != state.get(name)
+                }
+                state = new_state
+
+                if not len(changed_now):
+                    break
+
+                changed |= changed_now
+                await asyncio.sleep(self.debounce)
+
+            if len(changed):
+                yield {self.root / name for name in changed}
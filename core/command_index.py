@@ -0,0 +1,113 @@
+from typing import Iterable
+
+from kgemng import CommandManager
+from kgemng.command import Command
+from RelativeAddonsSystem import Addon
+
+
+def command_bodies(command: Command) -> list[str]:
+    if isinstance(command.body, str):
+        return [command.body]
+
+    return list(command.body)
+
+
+def command_heads(command: Command) -> set[str]:
+    heads = set()
+
+    for prefix in command.prefixes:
+        for body in command_bodies(command):
+            # Only the first word is compared, the rest of message is the command arguments
+            head = (prefix + body).split(maxsplit=1)
+
+            if len(head):
+                heads.add(head[0].lower())
+
+    return heads
+
+
+def declared_command_heads(commands: Iterable[str], prefixes: Iterable[str]) -> set[str]:
+    heads = set()
+
+    for prefix in prefixes:
+        for command in commands:
+            head = (prefix + command).split(maxsplit=1)
+
+            if len(head):
+                heads.add(head[0].lower())
+
+    return heads
+
+
+def message_head(text: str | None) -> str | None:
+    if not text:
+        return None
+
+    head = text.split(maxsplit=1)
+
+    if not len(head):
+        return None
+
+    return head[0].lower()
+
+
+def command_runs(command: Command, text: str | None, outgoing: bool) -> bool:
+    # Index matches heads case-insensitively, command managers run only enabled commands with exactly matching head
+    if not text or not command.enabled or (command.owner_only and not outgoing):
+        return False
+
+    head = text.split(maxsplit=1)[0]
+
+    return any(
+        (prefix + body).split(maxsplit=1)[:1] == [head]
+        for prefix in command.prefixes
+        for body in command_bodies(command)
+    )
+
+
+class CommandIndex:
+
+    _heads: dict[str, list[tuple[Command, CommandManager]]]
+    _lazy_heads: dict[str, list[Addon]]
+
+    def __init__(self):
+        self._heads = {}
+        # Commands declared in manifests of addons that aren't imported yet
+        self._lazy_heads = {}
+
+    def build(self, managers: list[CommandManager]):
+        heads = {}
+
+        for manager in managers:
+            for command in manager.get_registered_commands():
+                for head in command_heads(command):
+                    heads.setdefault(head, []).append((command, manager))
+
+        # Swapped at once, so lookups never see partially built index
+        self._heads = heads
+
+    def add_lazy(self, addon: Addon, heads: Iterable[str]):
+        for head in heads:
+            self._lazy_heads.setdefault(head, []).append(addon)
+
+    def remove_lazy(self, addon: Addon):
+        for head, addons in list(self._lazy_heads.items()):
+            addons = [lazy_addon for lazy_addon in addons if lazy_addon.meta.name != addon.meta.name]
+
+            if len(addons):
+                self._lazy_heads[head] = addons
+            else:
+                del self._lazy_heads[head]
+
+    def match(self, text: str | None) -> list[tuple[Command, CommandManager]]:
+        return self._heads.get(message_head(text), [])
+
+    def match_lazy(self, text: str | None) -> list[Addon]:
+        return self._lazy_heads.get(message_head(text), [])
+
+    def __contains__(self, text: str | None) -> bool:
+        head = message_head(text)
+        return head in self._heads or head in self._lazy_heads
+
+    def __len__(self):
+        return len(self._heads)
@@ -1,17 +1,210 @@
+import asyncio
+import logging
+import sys
 from pathlib import Path
-from typing import Callable
+from typing import Awaitable, Callable
 
-from RelativeAddonsSystem import RelativeAddonsSystem, Addon
+from RelativeAddonsSystem import RelativeAddonsSystem, Addon, libraries, utils
+from colorama import Fore
 from kgemng import CommandManager, EventManager
 
+from core.addons_index import AddonsIndex
+from core.dependencies import (
+    collect_requirements, resolve_requirements, pip_requirement, requirements_hash, read_lock, write_lock
+)
+from core.logs import get_logger, wrap_into_color
+
+logger = get_logger("AddonsSystem", logging.INFO)
+
 
 class CustomRelativeAddonsSystem(RelativeAddonsSystem):
 
-    def __init__(self, addons_directory: str | Path, auto_install_dependencies: bool = False):
-        super().__init__(addons_directory, auto_install_dependencies)
+    # Prefixes of commands declared in addon manifest, if manifest doesn't specify them
+    DEFAULT_PREFIXES = ["."]
+
+    def __init__(
+        self,
+        addons_directory: str | Path,
+        auto_install_dependencies: bool = False,
+        wheels_directory: str | Path | None = None,
+        offline: bool = False,
+        dependencies_lock_path: str | Path = Path(".dependencies.lock"),
+        index_path: str | Path | None = Path(".addons-index.json")
+    ):
+        # Requirements are installed for all addons at once by install_dependencies(), not by addon
+        super().__init__(addons_directory, False)
+
+        self.auto_install_dependencies = auto_install_dependencies
+        self._wheels_directory = Path(wheels_directory) if wheels_directory else None
+        self._offline = offline
+        self._dependencies_lock_path = Path(dependencies_lock_path)
+        self._index = AddonsIndex(Path(index_path) if index_path else None)
+        self._addons_by_name: dict[str, Addon] = {}
+        # (addon name, manager kind) -> manager returned by addon module
+        self._managers: dict[tuple[str, str], CommandManager | EventManager] = {}
 
         self._main_addon = None
 
+    async def _pip(self, *arguments: str) -> bool:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "pip", *arguments,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT
+        )
+        output, _ = await process.communicate()
+
+        if process.returncode != 0:
+            logger.error(
+                "pip {command} failed -> ".format(command=arguments[0])
+                + wrap_into_color(output.decode(errors="replace"), color=Fore.RED)
+            )
+
+        return process.returncode == 0
+
+    def _requirements_problem(self, addons: list[Addon], missing: dict[str, str]):
+        requirements = collect_requirements(addons)
+
+        for library in missing:
+            for addons_names in requirements[library].values():
+                self.addon_with_requirements_problem.extend(addons_names)
+
+    async def install_dependencies(self, addons: list[Addon], install: bool = True) -> list[str]:
+        # Without install only checks requirements, it's used by shards: dependencies are installed once by supervisor
+        resolved, conflicts = resolve_requirements(collect_requirements(addons))
+
+        for library, versions in conflicts.items():
+            logger.warning(
+                "Conflicting requirements of library [ {library} ] -> ".format(
+                    library=wrap_into_color(library, color=Fore.YELLOW)
+                )
+                + wrap_into_color(
+                    ", ".join(
+                        f"{version} by {', '.join(addons_names)}" for version, addons_names in versions.items()
+                    ),
+                    color=Fore.RED
+                )
+            )
+
+            for addons_names in versions.values():
+                self.addon_with_requirements_problem.extend(addons_names)
+
+        lock_hash = requirements_hash(resolved)
+
+        # Installed libraries are checked even if lock matches, environment could be changed or recreated since
+        installed_libraries = libraries.get_installed_libraries()
+
+        missing = {}
+
+        for library, version in resolved.items():
+            try:
+                if library in installed_libraries and utils.check_version(version, installed_libraries[library]):
+                    continue
+            except ValueError:
+                pass
+
+            missing[library] = version
+
+        requirements = [pip_requirement(library, version) for library, version in missing.items()]
+
+        if len(requirements) and not install:
+            self._requirements_problem(addons, missing)
+            return []
+
+        if len(requirements) and self._offline and not self._wheels_directory:
+            logger.error(
+                "Offline mode requires wheels_dir, dependencies aren't installed: "
+                + wrap_into_color(", ".join(requirements), color=Fore.RED)
+            )
+            self._requirements_problem(addons, missing)
+            return []
+
+        if len(requirements):
+            logger.info(
+                "Installing addons dependencies: {requirements}".format(
+                    requirements=wrap_into_color(", ".join(requirements), color=Fore.YELLOW)
+                )
+            )
+
+            installed = True
+
+            if self._wheels_directory and not self._offline:
+                self._wheels_directory.mkdir(parents=True, exist_ok=True)
+                installed = await self._pip("download", "--dest", str(self._wheels_directory), *requirements)
+
+            if installed and self._wheels_directory:
+                installed = await self._pip(
+                    "install", "--no-index", "--find-links", str(self._wheels_directory), *requirements
+                )
+            elif installed:
+                installed = await self._pip("install", *requirements)
+
+            if not installed:
+                self._requirements_problem(addons, missing)
+                return []
+
+            libraries.get_installed_libraries(True)
+
+        if read_lock(self._dependencies_lock_path) != lock_hash:
+            write_lock(self._dependencies_lock_path, lock_hash)
+
+        return requirements
+
+    def get_all_addons(self, status: str | None = None) -> list[Addon]:
+        # Manifests are parsed only when changed, see AddonsIndex
+        addons = self._index.scan(self.directory)
+
+        self._addons_by_name = {addon.meta.name: addon for addon in addons}
+
+        return [addon for addon in addons if not status or addon.meta.get("status", "") == status]
+
+    def get_addon_by_name(self, name: str | Addon) -> Addon | None:
+        if isinstance(name, Addon):
+            return name
+        elif not isinstance(name, str):
+            raise ValueError("Expected str, but got {}".format(name.__class__.__name__))
+
+        addon = self._addons_by_name.get(name)
+
+        if addon is None or not addon.path.exists():
+            self.get_all_addons()
+            addon = self._addons_by_name.get(name)
+
+        return addon
+
+    def invalidate_addon(self, name: str | Addon):
+        # Called when addon is enabled, disabled or reloaded
+        addon = self.get_addon_by_name(name)
+
+        if not addon:
+            return
+
+        self._addons_by_name.pop(addon.meta.name, None)
+
+        for kind in ("command", "event"):
+            self._managers.pop((addon.meta.name, kind), None)
+
+    def _get_addon_manager(self, name: str | Addon, kind: str) -> CommandManager | EventManager:
+        addon = self.get_addon_by_name(name)
+
+        if not addon:
+            raise ValueError("Cannot find this addon")
+
+        manager = self._managers.get((addon.meta.name, kind))
+
+        if manager is not None:
+            return manager
+
+        module = addon.module
+
+        getter_name = "get_{kind}_manager".format(kind=kind)
+
+        if not hasattr(module, getter_name):
+            raise AttributeError("Module hasn't {kind} manager".format(kind=kind))
+
+        manager = self._managers[(addon.meta.name, kind)] = getattr(module, getter_name)()
+
+        return manager
+
     def set_main_addon(self, addon: Addon):
         if not isinstance(addon, Addon):
             raise ValueError("Cannot set main addon of type {type}".format(type=type(addon)))
@@ -22,32 +215,47 @@ class CustomRelativeAddonsSystem(RelativeAddonsSystem):
         return self._main_addon
 
     def get_addon_event_manager(self, name: str | Addon) -> EventManager:
+        return self._get_addon_manager(name, "event")
+
+    def get_addon_command_manager(self, name: str | Addon) -> CommandManager | None:
+        return self._get_addon_manager(name, "command")
+
+    def get_addon_update_types(self, name: str | Addon) -> list[str] | None:
         addon = self.get_addon_by_name(name)
 
         if not addon:
             raise ValueError("Cannot find this addon")
 
-        module = addon.module
+        update_types = addon.meta.get("update_types")
 
-        if not hasattr(module, "get_event_manager"):
-            raise AttributeError("Module hasn't event manager")
+        if update_types is not None and not isinstance(update_types, list):
+            raise ValueError("Addon update types must be a list of raw update type names")
 
-        return module.get_event_manager()
+        return update_types
 
-    def get_addon_command_manager(self, name: str | Addon) -> CommandManager | None:
+    def is_lazy_addon(self, name: str | Addon) -> bool:
         addon = self.get_addon_by_name(name)
 
         if not addon:
             raise ValueError("Cannot find this addon")
 
-        module = addon.module
+        return bool(addon.meta.get("lazy", False))
+
+    def get_addon_declared_commands(self, name: str | Addon) -> tuple[list[str], list[str]]:
+        addon = self.get_addon_by_name(name)
+
+        if not addon:
+            raise ValueError("Cannot find this addon")
+
+        commands = addon.meta.get("commands", [])
+        prefixes = addon.meta.get("prefixes", self.DEFAULT_PREFIXES)
 
-        if not hasattr(module, "get_command_manager"):
-            raise AttributeError("Module hasn't command manager")
+        if not isinstance(commands, list) or not isinstance(prefixes, list):
+            raise ValueError("Addon commands and prefixes must be lists of strings")
 
-        return module.get_command_manager()
+        return commands, prefixes
 
-    def get_addon_system_event_handler(self, name: str | Addon, event: str = "load") -> Callable[[], None]:
+    def get_addon_system_event_handler(self, name: str | Addon, event: str = "load") -> Callable[[], None | Awaitable[None]]:
         addon = self.get_addon_by_name(name)
 
         if not addon:
@@ -0,0 +1,81 @@
+import hashlib
+import json
+from pathlib import Path
+
+from RelativeAddonsSystem import Addon
+from RelativeAddonsSystem.utils import version_transform
+
+
+def version_parts(version: str | int | float) -> list[str]:
+    return str(version).split(".")
+
+
+def versions_compatible(first: str | int | float, second: str | int | float) -> bool:
+    for first_part, second_part in zip(version_parts(first), version_parts(second)):
+        if first_part == "*" or second_part == "*":
+            return True
+
+        if first_part != second_part:
+            return False
+
+    # Shorter version is a prefix of the longer one, the same way RelativeAddonsSystem checks versions
+    return True
+
+
+def most_specific_version(versions: list[str | int | float]) -> str:
+    # Among compatible versions the one with the most fixed parts satisfies others too
+    return str(max(versions, key=lambda version: len([part for part in version_parts(version) if part != "*"])))
+
+
+def collect_requirements(addons: list[Addon]) -> dict[str, dict[str, list[str]]]:
+    # {library name: {version: [names of addons required this version]}}
+    requirements = {}
+
+    for addon in addons:
+        for requirement in addon.meta.get("requirements", None) or []:
+            versions = requirements.setdefault(requirement["name"].lower(), {})
+            versions.setdefault(str(requirement.get("version", "*")), []).append(addon.meta.name)
+
+    return requirements
+
+
+def resolve_requirements(
+    requirements: dict[str, dict[str, list[str]]]
+) -> tuple[dict[str, str], dict[str, dict[str, list[str]]]]:
+    # Versions that satisfy all addons and requirements that can't be satisfied together
+    resolved = {}
+    conflicts = {}
+
+    for library, versions in requirements.items():
+        if all(
+            versions_compatible(first, second)
+            for first in versions
+            for second in versions
+        ):
+            resolved[library] = most_specific_version(list(versions))
+        else:
+            conflicts[library] = versions
+
+    return resolved, conflicts
+
+
+def pip_requirement(library: str, version: str) -> str:
+    if version == "*":
+        return library
+
+    return f"{library}=={version_transform.to_library_version(version)}"
+
+
+def requirements_hash(resolved: dict[str, str]) -> str:
+    return hashlib.sha256(json.dumps(sorted(resolved.items())).encode("utf8")).hexdigest()
+
+
+def read_lock(path: Path) -> str | None:
+    if not path.exists():
+        return None
+
+    return path.read_text(encoding="utf8").strip() or None
+
+
+def write_lock(path: Path, lock_hash: str):
+    path.write_text(lock_hash, encoding="utf8")
@@ -0,0 +1,69 @@
+import asyncio
+from contextlib import AsyncExitStack
+from typing import Awaitable, Callable
+
+from pyrogram import raw, utils
+
+
+PEERS = (raw.types.PeerUser, raw.types.PeerChat, raw.types.PeerChannel)
+
+
+def update_chat_id(update: raw.base.Update) -> int | None:
+    # Chat id of raw update as in Message.chat.id, None if update isn't bound to a chat
+    message = getattr(update, "message", None)
+    peer = getattr(message, "peer_id", None) or getattr(update, "peer", None)
+
+    if isinstance(peer, PEERS):
+        return utils.get_peer_id(peer)
+
+    if isinstance(getattr(update, "channel_id", None), int):
+        return utils.get_channel_id(update.channel_id)
+
+    if isinstance(getattr(update, "chat_id", None), int):
+        return -update.chat_id
+
+    if isinstance(getattr(update, "user_id", None), int):
+        return update.user_id
+
+    return None
+
+
+class DispatchExecutor:
+    # Each addon runs at most addon_concurrency handlers at once. Handlers of one chat are ordered by intake,
+    # which hands one update of a chat at a time, see IntakeQueue
+
+    def __init__(self, addon_concurrency: int = 10):
+        self.addon_concurrency = addon_concurrency
+
+        self._addon_semaphores: dict[str, asyncio.Semaphore] = {}
+
+        self.waiting = 0
+        self.running = 0
+        self.dispatched = 0
+
+    def _addon_semaphore(self, addon_name: str) -> asyncio.Semaphore:
+        semaphore = self._addon_semaphores.get(addon_name)
+
+        if semaphore is None:
+            semaphore = self._addon_semaphores[addon_name] = asyncio.Semaphore(self.addon_concurrency)
+
+        return semaphore
+
+    async def run(self, addons_names: list[str], work: Callable[[], Awaitable]):
+        self.dispatched += 1
+
+        async with AsyncExitStack() as stack:
+            if self.addon_concurrency:
+                self.waiting += 1
+                try:
+                    # Semaphores are taken in the same order everywhere, so handlers of several addons can't deadlock
+                    for addon_name in sorted(set(addons_names)):
+                        await stack.enter_async_context(self._addon_semaphore(addon_name))
+                finally:
+                    self.waiting -= 1
+
+            self.running += 1
+            try:
+                await work()
+            finally:
+                self.running -= 1
@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Hashable
+
+from colorama import Fore
+from pyrogram import ContinuePropagation, StopPropagation, raw
+
+from core.logs import get_logger, wrap_into_color
+
+logger = get_logger("Intake", logging.INFO)
+
+OWNER_COMMAND = 0
+MESSAGE = 1
+UPDATE = 2
+
+PRIORITY_NAMES = {OWNER_COMMAND: "owner commands", MESSAGE: "messages", UPDATE: "updates"}
+
+MESSAGE_UPDATES = (
+    raw.types.UpdateNewMessage,
+    raw.types.UpdateNewChannelMessage,
+    raw.types.UpdateEditMessage,
+    raw.types.UpdateEditChannelMessage,
+)
+
+# Policies of choosing work to shed from the lowest priority present in full queue
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+POLICIES = (DROP_OLDEST, DROP_NEWEST)
+
+
+def update_priority(update: raw.base.Update) -> int:
+    return MESSAGE if isinstance(update, MESSAGE_UPDATES) else UPDATE
+
+
+class IntakeItem:
+    __slots__ = ("account_id", "chat_key", "priority", "work", "droppable", "queued_at")
+
+    def __init__(
+        self,
+        account_id: int,
+        chat_key: Hashable,
+        priority: int,
+        work: Callable[[], Awaitable] | None,
+        droppable: bool
+    ):
+        self.account_id = account_id
+        self.chat_key = chat_key
+        self.priority = priority
+        # None when item is shed
+        self.work = work
+        self.droppable = droppable
+        self.queued_at = time.monotonic()
+
+
+class IntakeQueue:
+    # Bounded stage between client handlers and managers. Queued and handled work together is limited by max_size,
+    # above it queued work of the lowest priority is shed, owner commands are always accepted.
+    # Work of one chat is taken in arrival order, one at a time, otherwise chats with higher priority work go first.
+    # Droppable work above chat_queue_limit of its chat, or waiting longer than max_wait, is dropped
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        policy: str = DROP_OLDEST,
+        concurrency: int = 100,
+        chat_queue_limit: int = 50,
+        max_wait: float = 30
+    ):
+        if policy not in POLICIES:
+            raise ValueError(
+                "Unknown intake policy {policy}, expected one of: {policies}".format(
+                    policy=policy, policies=", ".join(POLICIES)
+                )
+            )
+
+        self.max_size = max_size
+        self.policy = policy
+        self.concurrency = max(concurrency, 1)
+        self.chat_queue_limit = chat_queue_limit
+        self.max_wait = max_wait
+
+        # Queued items of each priority in arrival order, to choose work to shed
+        self._items: dict[int, OrderedDict[IntakeItem, None]] = {
+            OWNER_COMMAND: OrderedDict(), MESSAGE: OrderedDict(), UPDATE: OrderedDict()
+        }
+        # Queued items of each chat in arrival order, shed items are skipped when they become the first.
+        # Chat stays here while its item is handled, even without queued items
+        self._chats: dict[Hashable, deque[IntakeItem]] = {}
+        # Queued items of each chat that aren't shed
+        self._chat_sizes: dict[Hashable, int] = {}
+        # Chats that can be taken from, by priority of their first item
+        self._ready: dict[int, deque[Hashable]] = {OWNER_COMMAND: deque(), MESSAGE: deque(), UPDATE: deque()}
+
+        self._available = asyncio.Event()
+        self._consumer: asyncio.Task | None = None
+        self._handlers: set[asyncio.Task] = set()
+
+        self.handling = 0
+        self.accepted = 0
+        self.max_seen_size = 0
+        self.max_chat_size = 0
+        self.dropped_overflow = 0
+        self.dropped_stale = 0
+        self.shed_by_account: dict[int, int] = {}
+        self.shed_by_priority: dict[int, int] = {priority: 0 for priority in self._items}
+
+    @property
+    def size(self) -> int:
+        # Queued work, not taken for handling yet
+        return sum(len(items) for items in self._items.values())
+
+    @property
+    def shed(self) -> int:
+        return sum(self.shed_by_priority.values())
+
+    def _shed(self, priority: int, account_id: int):
+        self.shed_by_priority[priority] += 1
+        self.shed_by_account[account_id] = self.shed_by_account.get(account_id, 0) + 1
+
+    def _forget(self, item: IntakeItem):
+        # Item left the queue: taken, shed or dropped
+        del self._items[item.priority][item]
+
+        size = self._chat_sizes[item.chat_key] - 1
+
+        if size:
+            self._chat_sizes[item.chat_key] = size
+        else:
+            del self._chat_sizes[item.chat_key]
+
+    def put(
+        self,
+        priority: int,
+        account_id: int,
+        chat_key: Hashable | None,
+        work: Callable[[], Awaitable],
+        droppable: bool = True
+    ) -> bool:
+        chat_size = self._chat_sizes.get(chat_key, 0) if chat_key is not None else 0
+
+        if droppable and self.chat_queue_limit and chat_size >= self.chat_queue_limit:
+            self.dropped_overflow += 1
+            return False
+
+        if priority != OWNER_COMMAND and self.max_size and self.size + self.handling >= self.max_size:
+            queued = [queued_priority for queued_priority, items in self._items.items() if len(items)]
+
+            if not len(queued) or priority > max(queued) or (priority == max(queued) and self.policy == DROP_NEWEST):
+                self._shed(priority, account_id)
+                return False
+
+            shed_item = next(
+                reversed(self._items[max(queued)]) if self.policy == DROP_NEWEST else iter(self._items[max(queued)])
+            )
+            self._forget(shed_item)
+            shed_item.work = None
+            self._shed(shed_item.priority, shed_item.account_id)
+
+        # Work without chat isn't ordered with anything
+        item = IntakeItem(account_id, chat_key if chat_key is not None else object(), priority, work, droppable)
+
+        self._items[priority][item] = None
+        # Shed item could be of the same chat
+        chat_size = self._chat_sizes.get(item.chat_key, 0) + 1
+        self._chat_sizes[item.chat_key] = chat_size
+        self.max_chat_size = max(self.max_chat_size, chat_size)
+
+        items = self._chats.get(item.chat_key)
+
+        if items is None:
+            items = self._chats[item.chat_key] = deque()
+            self._ready[priority].append(item.chat_key)
+
+        items.append(item)
+
+        self.accepted += 1
+        self.max_seen_size = max(self.max_seen_size, self.size + self.handling)
+
+        if self._consumer is None:
+            self.start()
+
+        self._available.set()
+
+        return True
+
+    def _first_item(self, chat_key: Hashable) -> IntakeItem | None:
+        items = self._chats[chat_key]
+        now = time.monotonic()
+
+        while len(items):
+            item = items[0]
+
+            if item.work is not None and item.droppable and self.max_wait and now - item.queued_at > self.max_wait:
+                self._forget(item)
+                item.work = None
+                self.dropped_stale += 1
+
+            if item.work is not None:
+                break
+
+            items.popleft()
+
+        return items[0] if len(items) else None
+
+    def _take(self) -> IntakeItem | None:
+        priority = OWNER_COMMAND
+
+        while priority in self._ready:
+            chats = self._ready[priority]
+
+            if not len(chats):
+                priority += 1
+                continue
+
+            chat_key = chats.popleft()
+            item = self._first_item(chat_key)
+
+            if item is None:
+                del self._chats[chat_key]
+                continue
+
+            if item.priority != priority:
+                # First item of chat was shed since chat became ready, chat is queued by its current first item
+                self._ready[item.priority].append(chat_key)
+                priority = min(priority, item.priority)
+                continue
+
+            self._chats[chat_key].popleft()
+            self._forget(item)
+
+            return item
+
+        return None
+
+    def _release(self, chat_key: Hashable):
+        # Item of chat is handled, the next one can be taken
+        item = self._first_item(chat_key)
+
+        if item is None:
+            del self._chats[chat_key]
+        else:
+            self._ready[item.priority].append(chat_key)
+
+    async def _handle(self, item: IntakeItem):
+        # Slot is held until work is done, so handled work counts against max_size as well
+        try:
+            await item.work()
+        except (ContinuePropagation, StopPropagation):
+            pass
+        except Exception as e:
+            logger.warning("Error while processing update -> " + wrap_into_color(repr(e), color=Fore.RED))
+        finally:
+            self.handling -= 1
+            self._release(item.chat_key)
+            self._available.set()
+
+    async def _consume(self):
+        while True:
+            item = self._take() if self.handling < self.concurrency else None
+
+            if item is None:
+                self._available.clear()
+                await self._available.wait()
+                continue
+
+            self.handling += 1
+
+            task = asyncio.create_task(self._handle(item))
+            self._handlers.add(task)
+            task.add_done_callback(self._handlers.discard)
+
+    def start(self):
+        if self._consumer is not None:
+            return
+
+        self._consumer = asyncio.create_task(self._consume())
+
+    def stop(self):
+        for task in (self._consumer, *self._handlers):
+            if task is not None:
+                task.cancel()
+
+        self._consumer = None
@@ -1,9 +1,15 @@
+import atexit
+import copy
+import json
 import logging
+import queue
+import re
 from logging import getLogger, Formatter, StreamHandler, WARNING
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 from colorama import init, Fore, Style, Back
 
-from config import name
+from config import name, log_file, log_file_max_bytes, log_file_backups
 
 init()
 
@@ -20,48 +26,115 @@ level_colors = {
     logging.CRITICAL: Fore.RED + Back.WHITE
 }
 
+color_codes = re.compile(r"\x1b\[[0-9;]*m")
 
-class LevelFilter(logging.Filter):
-    def __init__(self, level: int):
+
+class ColorFormatter(Formatter):
+    def __init__(self):
         super().__init__()
-        self._level = level
 
-    def filter(self, record: logging.LogRecord) -> bool:
-        return record.levelno == self._level
+        self._formatters = {
+            level: Formatter(
+                f"{level_color}%(levelname)s{Style.RESET_ALL} "
+                f"{Fore.WHITE}[{TIME_COLOR}%(asctime)s{Fore.WHITE}] {Style.RESET_ALL}%(name)s\n"
+                f"    {MESSAGE_COLOR}%(message)s{Style.RESET_ALL}\n"
+            )
+            for level, level_color in level_colors.items()
+        }
+
+    def format(self, record: logging.LogRecord) -> str:
+        formatter = self._formatters.get(record.levelno, self._formatters[logging.WARNING])
+
+        colored_name = "|".join(
+            f"{LOGGER_NAME_COLOR}{part}{Style.RESET_ALL}" for part in record.name.split("|")
+        )
+
+        plain_name, record.name = record.name, colored_name
+
+        try:
+            return formatter.format(record)
+        finally:
+            record.name = plain_name
+
+
+class JsonLinesFormatter(Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": color_codes.sub("", record.getMessage()),
+        }
+
+        if record.exc_info:
+            line["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            line["exception"] = record.exc_text
+
+        return json.dumps(line, ensure_ascii=False)
+
+
+class RecordQueueHandler(QueueHandler):
+    # Default prepare() puts formatted traceback into message, here it's kept in exc_text for handlers of listener
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+
+        record.msg = record.message = record.getMessage()
+        record.args = None
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = Formatter().formatException(record.exc_info)
+
+        # Traceback objects keep frames alive while record waits in queue
+        record.exc_info = None
 
+        return record
 
-def stream_handler(level: int):
-    level_color = level_colors[level]
 
+def stream_handler():
     handler = StreamHandler()
-    handler.setFormatter(
-        Formatter(
-            f"{level_color}%(levelname)s{Style.RESET_ALL} "
-            f"{Fore.WHITE}[{TIME_COLOR}%(asctime)s{Fore.WHITE}] {Style.RESET_ALL}%(name)s\n"
-            f"    {MESSAGE_COLOR}%(message)s{Style.RESET_ALL}\n"
-        )
-    )
+    handler.setFormatter(ColorFormatter())
+
+    return handler
 
-    handler.setLevel(level)
-    handler.addFilter(LevelFilter(level))
+
+def file_handler():
+    handler = RotatingFileHandler(
+        log_file, maxBytes=log_file_max_bytes, backupCount=log_file_backups, encoding="utf8"
+    )
+    handler.setFormatter(JsonLinesFormatter())
 
     return handler
 
 
+# Records are put into queue by loggers and written to the terminal and file from the listener thread
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
+queue_handler = RecordQueueHandler(log_queue)
+
+listener = QueueListener(
+    log_queue,
+    *((stream_handler(), file_handler()) if log_file else (stream_handler(),)),
+    respect_handler_level=True
+)
+listener.start()
+atexit.register(listener.stop)
+
+loggers: dict[str, logging.Logger] = {}
+
+
 def get_logger(logger_name: str, log_level=WARNING) -> logging.Logger:
-    logger_name = (
-        f"{LOGGER_NAME_COLOR}KuyuGenesis{Style.RESET_ALL}"
-        f"|{LOGGER_NAME_COLOR}{name}{Style.RESET_ALL}"
-        f"|{LOGGER_NAME_COLOR}{logger_name}{Style.RESET_ALL}"
-    )
+    logger_name = f"KuyuGenesis|{name}|{logger_name}"
+
+    if logger_name in loggers:
+        return loggers[logger_name]
+
     logger = getLogger(logger_name)
 
     logger.setLevel(level=log_level)
-    logger.addHandler(stream_handler(logging.DEBUG))
-    logger.addHandler(stream_handler(logging.INFO))
-    logger.addHandler(stream_handler(logging.WARNING))
-    logger.addHandler(stream_handler(logging.ERROR))
-    logger.addHandler(stream_handler(logging.CRITICAL))
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    loggers[logger_name] = logger
 
     return logger
 
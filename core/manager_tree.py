@@ -0,0 +1,80 @@
+from collections import deque
+
+from kgemng import CommandManager, EventManager
+from RelativeAddonsSystem import Addon
+
+Manager = CommandManager | EventManager
+
+
+def manager_addon_name(manager: Manager) -> str:
+    addon = manager.addon
+
+    if isinstance(addon, Addon):
+        return addon.meta.name
+
+    return "Built-in"
+
+
+def walk_managers(root: Manager | None) -> list[Manager]:
+    managers = []
+    checked_managers = set()
+
+    queue = deque([root])
+
+    while len(queue):
+        manager = queue.popleft()
+
+        if not manager or id(manager) in checked_managers:
+            continue
+
+        checked_managers.add(id(manager))
+        managers.append(manager)
+        queue.extend(manager.get_included_managers())
+
+    return managers
+
+
+class ManagerTreeSnapshot:
+    def __init__(self, root: Manager | None):
+        self.managers = walk_managers(root)
+
+        self.managers_by_addon: dict[str, int] = {}
+        self.commands_by_addon: dict[str, int] = {}
+
+        for manager in self.managers:
+            name = manager_addon_name(manager)
+            self.managers_by_addon[name] = self.managers_by_addon.get(name, 0) + 1
+
+            if isinstance(manager, CommandManager):
+                self.commands_by_addon[name] = (
+                    self.commands_by_addon.get(name, 0) + len(manager.get_registered_commands())
+                )
+
+    def __len__(self):
+        return len(self.managers)
+
+
+class ManagerTree:
+    # Flattened manager tree, that is built once and reused until tree is changed
+
+    def __init__(self):
+        self._root: Manager | None = None
+        self._snapshot: ManagerTreeSnapshot | None = None
+
+    @property
+    def root(self) -> Manager | None:
+        return self._root
+
+    @root.setter
+    def root(self, root: Manager | None):
+        self._root = root
+        self.invalidate()
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def snapshot(self) -> ManagerTreeSnapshot:
+        if self._snapshot is None:
+            self._snapshot = ManagerTreeSnapshot(self._root)
+
+        return self._snapshot
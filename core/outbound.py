@@ -0,0 +1,353 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Hashable
+
+from colorama import Fore
+from pyrogram import errors
+
+from core.logs import get_logger, wrap_into_color
+
+logger = get_logger("Outbound", logging.INFO)
+
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+PRIORITY_NAMES = {HIGH: "high", NORMAL: "normal", LOW: "low"}
+
+# Priority of requests made without explicit priority, set to HIGH while owner commands are executed
+current_priority: ContextVar[int] = ContextVar("outbound_priority", default=NORMAL)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+
+    def delay(self) -> float:
+        # Seconds until a token is available
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._updated_at) * self.rate, self.burst)
+        self._updated_at = now
+
+        if self._tokens >= 1:
+            return 0.0
+
+        return (1 - self._tokens) / self.rate
+
+    def take(self):
+        self._tokens -= 1
+
+
+class OutboundRequest:
+    __slots__ = ("method", "args", "kwargs", "chat_id", "priority", "future", "attempts", "key", "not_before")
+
+    def __init__(
+        self,
+        method: Callable[..., Awaitable],
+        args: tuple,
+        kwargs: dict,
+        chat_id: int | str | None,
+        priority: int,
+        future: asyncio.Future,
+        key: Hashable | None = None,
+        not_before: float = 0.0
+    ):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.chat_id = chat_id
+        self.priority = priority
+        self.future = future
+        self.attempts = 0
+        self.key = key
+        self.not_before = not_before
+
+
+class OutboundScheduler:
+    # Paces requests of one account: token bucket for the account, minimal interval between requests to a chat,
+    # and a pause of the whole account after FloodWait, after which failed request is sent again
+
+    def __init__(
+        self,
+        rate: float = 20,
+        burst: int = 30,
+        chat_interval: float = 1.0,
+        in_flight: int = 5,
+        retries: int = 3,
+        max_flood_wait: float = 300
+    ):
+        self.chat_interval = chat_interval
+        self.in_flight = in_flight
+        self.retries = retries
+        self.max_flood_wait = max_flood_wait
+
+        self._bucket = TokenBucket(rate, burst)
+        # Requests of every priority are queued by chat, chats are sent from in order of their readiness:
+        # heap of (ready at, sequence, chat), only the latest entry of a chat is valid, older ones are skipped
+        self._queues: dict[int, dict[int | str | None, deque[OutboundRequest]]] = {HIGH: {}, NORMAL: {}, LOW: {}}
+        self._ready: dict[int, list[tuple[float, int, int | str | None]]] = {HIGH: [], NORMAL: [], LOW: []}
+        self._scheduled: dict[tuple[int, int | str | None], int] = {}
+        self._sequence = itertools.count()
+        self._queued = 0
+        self._chat_ready_at: dict[int | str, float] = {}
+        # Queued requests that later requests with the same key replace, e.g. edits of one message
+        self._coalescing: dict[Hashable, OutboundRequest] = {}
+        self._paused_until = 0.0
+        self._running = 0
+
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+        self._sending: set[asyncio.Task] = set()
+
+        self.sent = 0
+        self.failed = 0
+        self.throttled = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0.0
+        self.max_queued = 0
+        self.coalesced = 0
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def queue_depth(self) -> dict[str, int]:
+        return {
+            PRIORITY_NAMES[priority]: sum(len(requests) for requests in chats.values())
+            for priority, chats in self._queues.items()
+        }
+
+    async def submit(
+        self,
+        method: Callable[..., Awaitable],
+        *args,
+        chat_id: int | str | None = None,
+        priority: int | None = None,
+        coalesce_key: Hashable | None = None,
+        delay: float = 0.0,
+        **kwargs
+    ) -> Any:
+        priority = current_priority.get() if priority is None else priority
+
+        if coalesce_key is not None and coalesce_key in self._coalescing:
+            # Request isn't sent yet, so it is sent with the latest arguments and all callers get its result
+            request = self._coalescing[coalesce_key]
+            request.args = args
+            request.kwargs = kwargs
+            self.coalesced += 1
+
+            if priority < request.priority:
+                self._remove(request)
+                request.priority = priority
+                self._enqueue(request)
+
+            return await asyncio.shield(request.future)
+
+        future = asyncio.get_running_loop().create_future()
+        request = OutboundRequest(
+            method, args, kwargs, chat_id, priority, future, coalesce_key, time.monotonic() + delay
+        )
+
+        self._enqueue(request)
+        self.max_queued = max(self.max_queued, self.queued)
+
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+        self._wakeup.set()
+
+        if coalesce_key is not None:
+            # Coalesced request is shared by callers, one of them stopping waiting must not cancel it
+            return await asyncio.shield(future)
+
+        return await future
+
+    def _request_ready_at(self, request: OutboundRequest) -> float:
+        return max(
+            self._chat_ready_at.get(request.chat_id, 0.0) if request.chat_id is not None else 0.0,
+            request.not_before
+        )
+
+    def _schedule(self, priority: int, chat_id: int | str | None):
+        # Puts chat into readiness heap by its first request, previous entry of the chat becomes stale
+        sequence = next(self._sequence)
+        self._scheduled[(priority, chat_id)] = sequence
+
+        heapq.heappush(
+            self._ready[priority],
+            (self._request_ready_at(self._queues[priority][chat_id][0]), sequence, chat_id)
+        )
+
+    def _enqueue(self, request: OutboundRequest, first: bool = False):
+        chats = self._queues[request.priority]
+        requests = chats.get(request.chat_id)
+        new_chat = requests is None
+
+        if new_chat:
+            requests = chats[request.chat_id] = deque()
+
+        if first:
+            requests.appendleft(request)
+        else:
+            requests.append(request)
+
+        self._queued += 1
+
+        if new_chat or first:
+            self._schedule(request.priority, request.chat_id)
+
+        if request.key is not None:
+            self._coalescing.setdefault(request.key, request)
+
+    def _remove(self, request: OutboundRequest):
+        chats = self._queues[request.priority]
+        requests = chats[request.chat_id]
+        first = requests[0] is request
+
+        requests.remove(request)
+        self._queued -= 1
+
+        if request.key is not None and self._coalescing.get(request.key) is request:
+            del self._coalescing[request.key]
+
+        if not len(requests):
+            del chats[request.chat_id]
+            del self._scheduled[(request.priority, request.chat_id)]
+        elif first:
+            self._schedule(request.priority, request.chat_id)
+
+    def _next_request(self, now: float) -> tuple[OutboundRequest | None, float]:
+        wait = math.inf
+
+        if len(self._chat_ready_at) > 1000:
+            self._chat_ready_at = {chat: ready_at for chat, ready_at in self._chat_ready_at.items() if ready_at > now}
+
+        for priority, heap in self._ready.items():
+            while len(heap):
+                ready_at, sequence, chat_id = heap[0]
+
+                if self._scheduled.get((priority, chat_id)) != sequence:
+                    heapq.heappop(heap)
+                    continue
+
+                request = self._queues[priority][chat_id][0]
+
+                # Callers stopped waiting, request is dropped
+                if request.future.done():
+                    self._remove(request)
+                    continue
+
+                # Chat was sent to by request of another priority since it was scheduled
+                if self._request_ready_at(request) > ready_at:
+                    self._schedule(priority, chat_id)
+                    continue
+
+                if ready_at > now:
+                    wait = min(wait, ready_at - now)
+                    break
+
+                self._remove(request)
+                return request, 0.0
+
+        return None, wait
+
+    async def _sleep_or_wakeup(self, timeout: float | None):
+        self._wakeup.clear()
+
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+
+            if self._paused_until > now:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            if self._running >= self.in_flight:
+                await self._sleep_or_wakeup(None)
+                continue
+
+            request, wait = self._next_request(now)
+
+            if request is None:
+                if not self.queued and not self._running:
+                    return
+
+                await self._sleep_or_wakeup(None if math.isinf(wait) else wait)
+                continue
+
+            delay = self._bucket.delay()
+
+            if delay:
+                self.throttled += 1
+                self._enqueue(request, first=True)
+                await asyncio.sleep(delay)
+                continue
+
+            self._bucket.take()
+
+            if request.chat_id is not None:
+                self._chat_ready_at[request.chat_id] = now + self.chat_interval
+
+            self._running += 1
+
+            # Loop keeps only weak references to tasks, sending task mustn't be collected before it's done
+            task = asyncio.create_task(self._send(request))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, request: OutboundRequest):
+        try:
+            result = await request.method(*request.args, **request.kwargs)
+        except errors.FloodWait as e:
+            self.flood_waits += 1
+            self.flood_wait_seconds += e.value
+
+            if request.attempts >= self.retries or e.value > self.max_flood_wait:
+                self.failed += 1
+
+                if not request.future.done():
+                    request.future.set_exception(e)
+                return
+
+            request.attempts += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + e.value)
+            self._enqueue(request, first=True)
+
+            logger.warning(
+                "FloodWait for {seconds}s on [ {method} ], requests are paused and it will be sent again".format(
+                    seconds=wrap_into_color(str(e.value), color=Fore.RED),
+                    method=wrap_into_color(getattr(request.method, "__name__", repr(request.method)), color=Fore.YELLOW)
+                )
+            )
+        except Exception as e:
+            self.failed += 1
+
+            if not request.future.done():
+                request.future.set_exception(e)
+        else:
+            self.sent += 1
+
+            if not request.future.done():
+                request.future.set_result(result)
+        finally:
+            self._running -= 1
+            self._wakeup.set()
@@ -0,0 +1,109 @@
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Hashable
+
+from pyrogram import ContinuePropagation, StopPropagation
+
+PerfKey = tuple[str, Hashable]
+
+current_keys: ContextVar[tuple[PerfKey, ...]] = ContextVar("current_perf_keys", default=())
+
+
+class LatencyHistogram:
+    # Log-scale buckets: each bucket is BUCKET_GROWTH times wider than previous, starting from MIN_LATENCY
+    MIN_LATENCY = 0.00001
+    BUCKET_GROWTH = 2 ** 0.25
+    BUCKETS_COUNT = 96
+
+    def __init__(self):
+        self.buckets = [0] * self.BUCKETS_COUNT
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _bucket(self, latency: float) -> int:
+        if latency <= self.MIN_LATENCY:
+            return 0
+
+        return min(int(math.log(latency / self.MIN_LATENCY, self.BUCKET_GROWTH)) + 1, self.BUCKETS_COUNT - 1)
+
+    def _bucket_upper_bound(self, bucket: int) -> float:
+        return self.MIN_LATENCY * self.BUCKET_GROWTH ** bucket
+
+    def record(self, latency: float):
+        self.buckets[self._bucket(latency)] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def percentile(self, percent: float) -> float:
+        if not self.count:
+            return 0.0
+
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+
+            if seen >= rank:
+                return min(self._bucket_upper_bound(bucket), self.max)
+
+        return self.max
+
+    @property
+    def average(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class PerformanceMonitor:
+    COMMAND = "command"
+    EVENT = "event"
+    ADDON = "addon"
+    ACCOUNT = "account"
+
+    def __init__(self):
+        self._histograms: dict[PerfKey, LatencyHistogram] = {}
+
+    def get_histogram(self, key: PerfKey) -> LatencyHistogram:
+        histogram = self._histograms.get(key)
+
+        if histogram is None:
+            histogram = self._histograms[key] = LatencyHistogram()
+
+        return histogram
+
+    def get_histograms(self, scope: str | None = None) -> dict[PerfKey, LatencyHistogram]:
+        return {
+            key: histogram
+            for key, histogram in self._histograms.items()
+            if scope is None or key[0] == scope
+        }
+
+    def record(self, keys: tuple[PerfKey, ...], latency: float):
+        for key in keys:
+            self.get_histogram(key).record(latency)
+
+    def record_error(self, keys: tuple[PerfKey, ...] | None = None):
+        # Without keys, error is attributed to the handlers measured in current context
+        for key in keys if keys is not None else current_keys.get():
+            self.get_histogram(key).errors += 1
+
+    @contextmanager
+    def measure(self, *keys: PerfKey):
+        token = current_keys.set(keys)
+        started_at = time.perf_counter()
+
+        try:
+            yield
+        except (ContinuePropagation, StopPropagation):
+            raise
+        except Exception:
+            self.record_error(keys)
+            raise
+        finally:
+            self.record(keys, time.perf_counter() - started_at)
+            current_keys.reset(token)
@@ -0,0 +1,437 @@
+import asyncio
+import inspect
+import itertools
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Callable
+
+from colorama import Fore
+
+from core.account_manager import AccountManager
+from core.logs import get_logger, wrap_into_color
+
+logger = get_logger("Sharding", logging.INFO)
+
+ADDRESS_ENVIRONMENT = "KUYUGENESIS_SHARDS_ADDRESS"
+AUTHKEY_ENVIRONMENT = "KUYUGENESIS_SHARDS_AUTHKEY"
+
+# Workers that ran longer than this are restarted without backoff
+STABLE_RUN_SECONDS = 60
+
+# Methods that every shard runs for call_all_shards(): name -> callable(account_manager, *args)
+SHARD_METHODS: dict[str, Callable] = {}
+
+ACCOUNT_MANAGER: AccountManager | None = None
+CONNECTION: "ShardConnection | None" = None
+
+
+def shard_accounts(accounts_count: int, shard: int | None, shards: int) -> list[int]:
+    # Session indexes (account = 1, account-2 = 2, ...) owned by shard, all of them without sharding
+    if shard is None:
+        return list(range(1, accounts_count + 1))
+
+    return [index for index in range(1, accounts_count + 1) if (index - 1) % shards == shard]
+
+
+def shard_method(name: str | None = None):
+    def decorator(function: Callable) -> Callable:
+        SHARD_METHODS[name or function.__name__] = function
+        return function
+
+    return decorator
+
+
+async def run_shard_method(method: str, *args) -> Any:
+    if method not in SHARD_METHODS:
+        raise AttributeError("Shard method '{method}' isn't registered".format(method=method))
+
+    result = SHARD_METHODS[method](ACCOUNT_MANAGER, *args)
+
+    if inspect.isawaitable(result):
+        result = await result
+
+    return result
+
+
+async def call_all_shards(method: str, *args, timeout: float = 10) -> list:
+    # Results of method from every running shard, ordered by shard number
+    if CONNECTION is None:
+        return [await run_shard_method(method, *args)]
+
+    return await CONNECTION.call_all(method, *args, timeout=timeout)
+
+
+def read_messages(connection: Connection) -> asyncio.Queue:
+    # Messages are read by daemon thread, so blocked reads don't keep process alive; None means closed connection
+    loop = asyncio.get_running_loop()
+    messages = asyncio.Queue()
+
+    def read():
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                message = None
+
+            try:
+                loop.call_soon_threadsafe(messages.put_nowait, message)
+            except RuntimeError:
+                return
+
+            if message is None:
+                return
+
+    threading.Thread(target=read, name="ShardConnectionReader", daemon=True).start()
+
+    return messages
+
+
+class ShardConnection:
+    # Worker side of IPC channel with supervisor
+
+    def __init__(self, shard: int, address: str, authkey: bytes, health: Callable[[], dict], health_interval: float):
+        self.shard = shard
+
+        self._address = address
+        self._authkey = authkey
+        self._health = health
+        self._health_interval = health_interval
+
+        self._connection: Connection | None = None
+        self._requests: dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+        self._tasks: list[asyncio.Task] = []
+
+    async def connect(self):
+        self._connection = await asyncio.to_thread(Client, self._address, authkey=self._authkey)
+        self._connection.send(("hello", self.shard, os.getpid()))
+
+        self._tasks = [
+            asyncio.create_task(self._read()),
+            asyncio.create_task(self._send_health()),
+        ]
+
+    async def _read(self):
+        messages = read_messages(self._connection)
+
+        while True:
+            message = await messages.get()
+
+            if message is None:
+                logger.warning("Connection with shards supervisor is lost")
+                return
+
+            match message:
+                case ("call", call_id, method, args):
+                    asyncio.create_task(self._call(call_id, method, args))
+                case ("results", request_id, results):
+                    future = self._requests.pop(request_id, None)
+
+                    if future is not None and not future.done():
+                        future.set_result(results)
+
+    async def _call(self, call_id: int, method: str, args: tuple):
+        try:
+            reply = ("result", call_id, self.shard, True, await run_shard_method(method, *args))
+        except Exception as e:
+            reply = ("result", call_id, self.shard, False, repr(e))
+
+        try:
+            self._connection.send(reply)
+        except (EOFError, OSError):
+            return
+        except Exception as e:
+            # Result can't be pickled
+            self._connection.send(("result", call_id, self.shard, False, repr(e)))
+
+    async def _send_health(self):
+        while True:
+            try:
+                self._connection.send(("health", self.shard, self._health()))
+            except (EOFError, OSError):
+                return
+            except Exception as e:
+                logger.warning("Error while sending shard health -> " + wrap_into_color(repr(e), color=Fore.RED))
+
+            await asyncio.sleep(self._health_interval)
+
+    async def call_all(self, method: str, *args, timeout: float = 10) -> list:
+        request_id = next(self._ids)
+        future = self._requests[request_id] = asyncio.get_running_loop().create_future()
+
+        self._connection.send(("call_all", request_id, method, args, timeout))
+
+        try:
+            results = await asyncio.wait_for(future, timeout + 1)
+        finally:
+            self._requests.pop(request_id, None)
+
+        values = []
+
+        for shard, (ok, value) in results:
+            if not ok:
+                logger.warning(
+                    "Shard {shard} failed to run [ {method} ] -> ".format(
+                        shard=shard, method=wrap_into_color(method, color=Fore.YELLOW)
+                    )
+                    + wrap_into_color(value, color=Fore.RED)
+                )
+                continue
+
+            values.append(value)
+
+        return values
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+
+        if self._connection is not None:
+            self._connection.close()
+
+
+def set_account_manager(account_manager: AccountManager):
+    global ACCOUNT_MANAGER
+    ACCOUNT_MANAGER = account_manager
+
+
+async def connect(shard: int, health: Callable[[], dict], health_interval: float = 30) -> ShardConnection:
+    global CONNECTION
+
+    CONNECTION = ShardConnection(
+        shard,
+        os.environ[ADDRESS_ENVIRONMENT],
+        bytes.fromhex(os.environ[AUTHKEY_ENVIRONMENT]),
+        health,
+        health_interval
+    )
+    await CONNECTION.connect()
+
+    return CONNECTION
+
+
+class ShardSupervisor:
+    # Runs worker processes, restarts crashed ones and relays calls between them
+
+    def __init__(
+        self,
+        shards: int,
+        arguments: list[str],
+        health_interval: float = 30,
+        restart_delay: float = 1,
+        max_restart_delay: float = 60
+    ):
+        self.shards = shards
+        self.health_interval = health_interval
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+
+        self._arguments = arguments
+        self._authkey = secrets.token_bytes(32)
+        self._listener: Listener | None = None
+
+        self.processes: dict[int, asyncio.subprocess.Process] = {}
+        self.connections: dict[int, Connection] = {}
+        self.health: dict[int, dict] = {}
+        self.restarts: dict[int, int] = {shard: 0 for shard in range(shards)}
+
+        # call id -> shard -> future with (ok, value) of shard
+        self._calls: dict[int, dict[int, asyncio.Future]] = {}
+        self._ids = itertools.count()
+
+    async def run(self):
+        self._listener = Listener(authkey=self._authkey)
+
+        threading.Thread(
+            target=self._accept, args=(asyncio.get_running_loop(),), name="ShardsListener", daemon=True
+        ).start()
+
+        health_task = asyncio.create_task(self._report_health())
+
+        logger.info(
+            "Starting {shards} shards".format(shards=wrap_into_color(str(self.shards), color=Fore.YELLOW))
+        )
+
+        try:
+            await asyncio.gather(*(self._keep_running(shard) for shard in range(self.shards)))
+        finally:
+            health_task.cancel()
+
+            for process in self.processes.values():
+                if process.returncode is None:
+                    process.terminate()
+
+            await asyncio.gather(*(process.wait() for process in self.processes.values()), return_exceptions=True)
+
+            self._listener.close()
+
+    async def _keep_running(self, shard: int):
+        failures = 0
+
+        environment = {
+            **os.environ,
+            ADDRESS_ENVIRONMENT: str(self._listener.address),
+            AUTHKEY_ENVIRONMENT: self._authkey.hex(),
+        }
+
+        while True:
+            started_at = time.monotonic()
+
+            process = self.processes[shard] = await asyncio.create_subprocess_exec(
+                sys.executable, *self._arguments, "--shard", str(shard), env=environment
+            )
+
+            return_code = await process.wait()
+
+            self.health.pop(shard, None)
+
+            if time.monotonic() - started_at > STABLE_RUN_SECONDS:
+                failures = 0
+
+            failures += 1
+            self.restarts[shard] += 1
+
+            delay = min(self.restart_delay * 2 ** (failures - 1), self.max_restart_delay)
+
+            logger.warning(
+                "Shard {shard} exited with code {code}, restarting in {delay}".format(
+                    shard=wrap_into_color(str(shard), color=Fore.YELLOW),
+                    code=wrap_into_color(str(return_code), color=Fore.RED),
+                    delay=f"{delay:.0f}s"
+                )
+            )
+
+            await asyncio.sleep(delay)
+
+    def _accept(self, loop: asyncio.AbstractEventLoop):
+        while True:
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                return
+            except Exception as e:
+                # Failed authentication and broken handshakes
+                logger.warning("Rejected shard connection -> " + wrap_into_color(repr(e), color=Fore.RED))
+                continue
+
+            try:
+                asyncio.run_coroutine_threadsafe(self._serve(connection), loop)
+            except RuntimeError:
+                return
+
+    async def _serve(self, connection: Connection):
+        messages = read_messages(connection)
+
+        match await messages.get():
+            case ("hello", shard, pid):
+                self.connections[shard] = connection
+            case _:
+                connection.close()
+                return
+
+        while (message := await messages.get()) is not None:
+            match message:
+                case ("health", _, health):
+                    self.health[shard] = dict(health, pid=pid, updated_at=time.monotonic())
+                case ("call_all", request_id, method, args, timeout):
+                    asyncio.create_task(self._call_all(shard, request_id, method, args, timeout))
+                case ("result", call_id, result_shard, ok, value):
+                    future = self._calls.get(call_id, {}).get(result_shard)
+
+                    if future is not None and not future.done():
+                        future.set_result((ok, value))
+
+        if self.connections.get(shard) is connection:
+            del self.connections[shard]
+
+        for futures in self._calls.values():
+            future = futures.get(shard)
+
+            if future is not None and not future.done():
+                future.set_result((False, "shard disconnected"))
+
+        connection.close()
+
+    def _send(self, shard: int, message: tuple):
+        connection = self.connections.get(shard)
+
+        if connection is None:
+            return False
+
+        try:
+            connection.send(message)
+        except (EOFError, OSError):
+            return False
+
+        return True
+
+    async def _call_all(self, origin: int, request_id: int, method: str, args: tuple, timeout: float):
+        loop = asyncio.get_running_loop()
+        call_id = next(self._ids)
+
+        futures = self._calls[call_id] = {}
+
+        for shard in list(self.connections):
+            futures[shard] = loop.create_future()
+
+            if not self._send(shard, ("call", call_id, method, args)):
+                futures[shard].set_result((False, "shard disconnected"))
+
+        try:
+            if len(futures):
+                await asyncio.wait(futures.values(), timeout=timeout)
+        finally:
+            del self._calls[call_id]
+
+        results = [
+            (shard, future.result() if future.done() else (False, "timed out"))
+            for shard, future in sorted(futures.items())
+        ]
+
+        self._send(origin, ("results", request_id, results))
+
+    def combined_health(self) -> dict[str, int]:
+        combined = {}
+
+        for health in self.health.values():
+            for name, value in health.items():
+                if name in ("pid", "updated_at") or not isinstance(value, (int, float)):
+                    continue
+
+                combined[name] = combined.get(name, 0) + value
+
+        return combined
+
+    async def _report_health(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+
+            lines = []
+
+            for shard in range(self.shards):
+                health = self.health.get(shard)
+
+                if health is None:
+                    lines.append(f"{shard}: " + wrap_into_color("not connected", color=Fore.RED))
+                    continue
+
+                lines.append(
+                    f"{shard}: pid {health['pid']}, restarts {self.restarts[shard]}, "
+                    + ", ".join(
+                        f"{name} {value}"
+                        for name, value in health.items()
+                        if name not in ("pid", "updated_at")
+                    )
+                )
+
+            logger.info(
+                "Shards health ({combined}):\n    ".format(
+                    combined=", ".join(f"{name} {value}" for name, value in self.combined_health().items())
+                )
+                + "\n    ".join(lines)
+            )
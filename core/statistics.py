@@ -0,0 +1,243 @@
+import asyncio
+import time
+from collections import deque
+from pathlib import Path
+from typing import Hashable
+
+import aiosqlite
+from colorama import Fore
+
+from core.logs import get_logger, wrap_into_color
+
+logger = get_logger("Statistics")
+
+
+class TopCounter:
+    # Counters with the top-k kept sorted on every increment, so reading the top costs O(k)
+
+    def __init__(self, k: int = 10):
+        self.k = k
+        self._counts: dict[Hashable, int] = {}
+        self._top: list[Hashable] = []
+        self.total = 0
+
+    def _bubble(self, index: int):
+        while index > 0 and self._counts[self._top[index]] > self._counts[self._top[index - 1]]:
+            self._top[index], self._top[index - 1] = self._top[index - 1], self._top[index]
+            index -= 1
+
+    def increment(self, key: Hashable, amount: int = 1):
+        count = self._counts.get(key, 0) + amount
+        self._counts[key] = count
+        self.total += amount
+
+        if key in self._top:
+            self._bubble(self._top.index(key))
+        elif len(self._top) < self.k:
+            self._top.append(key)
+            self._bubble(len(self._top) - 1)
+        elif count > self._counts[self._top[-1]]:
+            self._top[-1] = key
+            self._bubble(len(self._top) - 1)
+
+    def get(self, key: Hashable) -> int:
+        return self._counts.get(key, 0)
+
+    def top(self, n: int | None = None) -> list[tuple[Hashable, int]]:
+        return [(key, self._counts[key]) for key in self._top[:n]]
+
+    def items(self):
+        return self._counts.items()
+
+
+class SlidingWindowCounter:
+    # Counts in the last window_seconds, totals are updated incrementally when buckets expire
+
+    def __init__(self, window_seconds: int, bucket_seconds: int = 60):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+
+        self._buckets: deque[tuple[int, dict[Hashable, int]]] = deque()
+        self._totals: dict[Hashable, int] = {}
+
+    def _advance(self, bucket: int):
+        oldest_bucket = bucket - self.window_seconds // self.bucket_seconds
+
+        while len(self._buckets) and self._buckets[0][0] <= oldest_bucket:
+            _, counts = self._buckets.popleft()
+
+            for key, count in counts.items():
+                total = self._totals[key] - count
+
+                if total:
+                    self._totals[key] = total
+                else:
+                    del self._totals[key]
+
+    def increment(self, key: Hashable, amount: int = 1, timestamp: float | None = None):
+        current_bucket = int(time.time() // self.bucket_seconds)
+        bucket = int(timestamp // self.bucket_seconds) if timestamp is not None else current_bucket
+
+        self._advance(current_bucket)
+
+        if bucket <= current_bucket - self.window_seconds // self.bucket_seconds:
+            return
+
+        if not len(self._buckets) or self._buckets[-1][0] != bucket:
+            self._buckets.append((bucket, {}))
+
+        counts = self._buckets[-1][1]
+        counts[key] = counts.get(key, 0) + amount
+        self._totals[key] = self._totals.get(key, 0) + amount
+
+    def get(self, key: Hashable) -> int:
+        self._advance(int(time.time() // self.bucket_seconds))
+
+        return self._totals.get(key, 0)
+
+
+class CommandStatistics:
+    TOTAL = ""
+
+    HOUR = 3600
+    DAY = 86400
+
+    def __init__(self, k: int = 10):
+        self.commands = TopCounter(k)
+        self.addons = TopCounter(k)
+        self.accounts = TopCounter(k)
+        self.account_commands: dict[int, TopCounter] = {}
+
+        self.windows = {
+            self.HOUR: SlidingWindowCounter(self.HOUR),
+            self.DAY: SlidingWindowCounter(self.DAY),
+        }
+
+        # Commands recorded by this process, totals above also include ones loaded from storage
+        self.recorded = 0
+
+        self._k = k
+        self._connection: aiosqlite.Connection | None = None
+        self._flush_task: asyncio.Task | None = None
+        # Increments not written yet: shards share the database, so counters are stored by adding deltas
+        self._deltas: dict[tuple[str, str], int] = {}
+        self._pending_calls: list[tuple[int, str, str, int]] = []
+
+    def _account_commands(self, account_id: int) -> TopCounter:
+        counter = self.account_commands.get(account_id)
+
+        if counter is None:
+            counter = self.account_commands[account_id] = TopCounter(self._k)
+
+        return counter
+
+    def record(self, command: str, addon: str, account_id: int):
+        self.recorded += 1
+        self.commands.increment(command)
+        self.addons.increment(addon)
+        self.accounts.increment(account_id)
+        self._account_commands(account_id).increment(command)
+
+        for window in self.windows.values():
+            window.increment(command)
+            window.increment(self.TOTAL)
+
+        if self._connection is not None:
+            for counter in (
+                ("command", command), ("addon", addon), ("account", str(account_id)),
+                ("account_command", f"{account_id}:{command}")
+            ):
+                self._deltas[counter] = self._deltas.get(counter, 0) + 1
+
+            self._pending_calls.append((int(time.time()), command, addon, account_id))
+
+    @property
+    def total(self) -> int:
+        return self.commands.total
+
+    def count_in(self, window: int, command: str = TOTAL) -> int:
+        return self.windows[window].get(command)
+
+    def top_commands(self, n: int = 5, account_id: int | None = None) -> list[tuple[str, int]]:
+        if account_id is not None:
+            return self._account_commands(account_id).top(n)
+
+        return self.commands.top(n)
+
+    async def open(self, path: str | Path, flush_interval: float = 60):
+        connection = await aiosqlite.connect(str(path))
+
+        await connection.execute("PRAGMA journal_mode=WAL")
+        await connection.execute(
+            "CREATE TABLE IF NOT EXISTS counters ("
+            "scope TEXT NOT NULL, key TEXT NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (scope, key))"
+        )
+        await connection.execute(
+            "CREATE TABLE IF NOT EXISTS calls ("
+            "timestamp INTEGER NOT NULL, command TEXT NOT NULL, addon TEXT NOT NULL, account_id INTEGER NOT NULL)"
+        )
+        await connection.execute("CREATE INDEX IF NOT EXISTS calls_timestamp ON calls (timestamp)")
+        await connection.execute("DELETE FROM calls WHERE timestamp < ?", (int(time.time()) - self.DAY,))
+        await connection.commit()
+
+        async with connection.execute("SELECT scope, key, count FROM counters") as cursor:
+            async for scope, key, count in cursor:
+                match scope:
+                    case "command":
+                        self.commands.increment(key, count)
+                    case "addon":
+                        self.addons.increment(key, count)
+                    case "account":
+                        self.accounts.increment(int(key), count)
+                    case "account_command":
+                        account_id, command = key.split(":", 1)
+                        self._account_commands(int(account_id)).increment(command, count)
+
+        async with connection.execute("SELECT timestamp, command FROM calls ORDER BY timestamp") as cursor:
+            async for timestamp, command in cursor:
+                for window in self.windows.values():
+                    window.increment(command, timestamp=timestamp)
+                    window.increment(self.TOTAL, timestamp=timestamp)
+
+        self._connection = connection
+        self._flush_task = asyncio.create_task(self._flush_loop(flush_interval))
+
+    async def flush(self):
+        if self._connection is None or (not len(self._deltas) and not len(self._pending_calls)):
+            return
+
+        deltas, self._deltas = self._deltas, {}
+        calls, self._pending_calls = self._pending_calls, []
+
+        await self._connection.executemany(
+            "INSERT INTO counters VALUES (?, ?, ?) "
+            "ON CONFLICT (scope, key) DO UPDATE SET count = count + excluded.count",
+            [(scope, key, delta) for (scope, key), delta in deltas.items()]
+        )
+        await self._connection.executemany("INSERT INTO calls VALUES (?, ?, ?, ?)", calls)
+        await self._connection.execute("DELETE FROM calls WHERE timestamp < ?", (int(time.time()) - self.DAY,))
+        await self._connection.commit()
+
+    async def _flush_loop(self, flush_interval: float):
+        while True:
+            await asyncio.sleep(flush_interval)
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("Error while writing statistics -> " + wrap_into_color(repr(e), color=Fore.RED))
+
+    async def close(self):
+        if self._connection is None:
+            return
+
+        self._flush_task.cancel()
+
+        try:
+            await self._flush_task
+        except asyncio.CancelledError:
+            pass
+
+        await self.flush()
+        await self._connection.close()
+        self._connection = None
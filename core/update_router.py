@@ -0,0 +1,94 @@
+from typing import Iterable
+
+from kgemng import EventManager
+from pyrogram.raw import types
+from RelativeAddonsSystem import Addon
+
+
+class UpdateRouter:
+
+    _routes: dict[str, list[EventManager]]
+    _wildcard: list[EventManager]
+
+    def __init__(self):
+        self._routes = {}
+        self._wildcard = []
+        self._subscriptions: dict[int, tuple[EventManager, tuple[str, ...] | None]] = {}
+        # Update types declared in manifests of addons that aren't imported yet
+        self._lazy: dict[str, list[Addon]] = {}
+
+        self.routed_count = 0
+        self.dropped_count = 0
+        self.dropped_by_type: dict[str, int] = {}
+
+    def _rebuild(self):
+        routes = {}
+        wildcard = []
+
+        for manager, update_types in self._subscriptions.values():
+            if update_types is None:
+                wildcard.append(manager)
+                continue
+
+            for update_type in update_types:
+                routes.setdefault(update_type, []).append(manager)
+
+        self._routes = routes
+        self._wildcard = wildcard
+
+    def subscribe(self, manager: EventManager, update_types: Iterable[str] | None = None):
+        # update_types are names of raw update types (UpdateNewMessage, UpdateUserTyping, ...),
+        # None subscribes manager to all updates
+        if update_types is not None:
+            update_types = tuple(update_types)
+
+            for update_type in update_types:
+                if not hasattr(types, update_type):
+                    raise ValueError("Unknown update type {type}".format(type=update_type))
+
+        self._subscriptions[id(manager)] = (manager, update_types)
+        self._rebuild()
+
+    def unsubscribe(self, manager: EventManager):
+        if self._subscriptions.pop(id(manager), None) is not None:
+            self._rebuild()
+
+    def subscribe_lazy(self, addon: Addon, update_types: Iterable[str]):
+        update_types = tuple(update_types)
+
+        for update_type in update_types:
+            if not hasattr(types, update_type):
+                raise ValueError("Unknown update type {type}".format(type=update_type))
+
+        for update_type in update_types:
+            self._lazy.setdefault(update_type, []).append(addon)
+
+    def unsubscribe_lazy(self, addon: Addon):
+        for update_type, addons in list(self._lazy.items()):
+            addons = [lazy_addon for lazy_addon in addons if lazy_addon.meta.name != addon.meta.name]
+
+            if len(addons):
+                self._lazy[update_type] = addons
+            else:
+                del self._lazy[update_type]
+
+    def get_lazy_addons(self, update) -> list[Addon]:
+        return self._lazy.get(type(update).__name__, [])
+
+    def get_managers(self, update) -> list[EventManager]:
+        return self._routes.get(type(update).__name__, []) + self._wildcard
+
+    def get_routes(self) -> dict[str, list[EventManager]]:
+        return {update_type: managers.copy() for update_type, managers in self._routes.items()}
+
+    def route(self, update) -> bool:
+        update_type = type(update).__name__
+
+        if len(self._wildcard) or update_type in self._routes or update_type in self._lazy:
+            self.routed_count += 1
+            return True
+
+        self.dropped_count += 1
+        self.dropped_by_type[update_type] = self.dropped_by_type.get(update_type, 0) + 1
+
+        return False
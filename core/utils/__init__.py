@@ -1,6 +1,8 @@
 import inspect
 
-from .paginator import Paginator
+from .paginator import Paginator, PaginatorService
+from .page_sources import PageSource, ListPageSource, IteratorPageSource, CallbackPageSource
+from .paginator_storage import PaginatorStorage, StoredPageSource
 
 
 def params_generator(scope, variables, ignore_types=False):
@@ -0,0 +1,153 @@
+import inspect
+import math
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, Iterator
+
+FetchPage = Callable[[int, int], list | None | Awaitable[list | None]]
+
+
+class PageSource:
+    # Count of pages around the current one that stays cached
+    window = 2
+
+    def __init__(self, per_page: int):
+        self.per_page = per_page
+        self._pages: dict[int, list] = {}
+        self._last_page: int | None = None
+
+    async def _fetch(self, page: int) -> list | None:
+        raise NotImplementedError
+
+    def _forget(self, current_page: int):
+        for page in list(self._pages.keys()):
+            if abs(page - current_page) > self.window:
+                del self._pages[page]
+
+    @property
+    def last_page(self) -> int | None:
+        return self._last_page
+
+    async def get_page(self, page: int) -> list | None:
+        if page < 1 or (self._last_page is not None and page > self._last_page):
+            return None
+
+        if page in self._pages:
+            return self._pages[page]
+
+        elements = await self._fetch(page)
+
+        if not elements:
+            # The first page always exists, so empty sources are rendered as empty page
+            self._last_page = max(page - 1, 1)
+            return [] if page == 1 else None
+
+        self._pages[page] = elements
+
+        return elements
+
+    async def has_page(self, page: int) -> bool:
+        return await self.get_page(page) is not None
+
+    async def open_page(self, page: int) -> tuple[list | None, bool]:
+        # Returns elements of page and whether the next page exists
+        elements = await self.get_page(page)
+
+        if elements is None:
+            return None, False
+
+        has_next_page = await self.has_page(page + 1)
+        self._forget(page)
+
+        return elements, has_next_page
+
+
+class ListPageSource(PageSource):
+    def __init__(self, elements: list, per_page: int):
+        super().__init__(per_page)
+        self._elements = elements
+        self._last_page = max(math.ceil(len(elements) / per_page), 1)
+
+    async def get_page(self, page: int) -> list | None:
+        # Pages are slices of the elements list, so they aren't cached
+        if page < 1 or page > self._last_page:
+            return None
+
+        return self._elements[(page - 1) * self.per_page : page * self.per_page]
+
+
+class IteratorPageSource(PageSource):
+    def __init__(self, iterator: Iterable | AsyncIterable, per_page: int):
+        super().__init__(per_page)
+
+        if hasattr(iterator, "__aiter__"):
+            self._iterator: Iterator | AsyncIterator = iterator.__aiter__()
+        else:
+            self._iterator = iter(iterator)
+
+        self._pulled_pages = 0
+
+    async def _next_element(self) -> tuple[bool, Any]:
+        try:
+            if hasattr(self._iterator, "__anext__"):
+                return True, await self._iterator.__anext__()
+
+            return True, next(self._iterator)
+        except (StopIteration, StopAsyncIteration):
+            return False, None
+
+    async def _fetch(self, page: int) -> list | None:
+        # Iterator can't be rewound, so every pulled page is kept and pages are pulled in order
+        while self._pulled_pages < page:
+            elements = []
+
+            while len(elements) < self.per_page:
+                exists, element = await self._next_element()
+
+                if not exists:
+                    break
+
+                elements.append(element)
+
+            if not elements:
+                return None
+
+            self._pulled_pages += 1
+            self._pages[self._pulled_pages] = elements
+
+        return self._pages.get(page)
+
+    def _forget(self, current_page: int):
+        pass
+
+
+class CallbackPageSource(PageSource):
+    def __init__(self, fetch_page: FetchPage, per_page: int):
+        super().__init__(per_page)
+        self._fetch_page = fetch_page
+
+    async def _fetch(self, page: int) -> list | None:
+        elements = self._fetch_page(page, self.per_page)
+
+        if inspect.isawaitable(elements):
+            elements = await elements
+
+        return elements
+
+
+def make_page_source(elements: list | Iterable | AsyncIterable | FetchPage, per_page: int) -> PageSource:
+    if isinstance(elements, PageSource):
+        return elements
+
+    if isinstance(elements, (list, tuple)):
+        return ListPageSource(list(elements), per_page)
+
+    # Strings are iterable too, but paginating them by characters is never intended
+    if isinstance(elements, (str, bytes)):
+        raise ValueError("Cannot paginate object of type {type}".format(type=type(elements)))
+
+    if hasattr(elements, "__aiter__") or hasattr(elements, "__iter__"):
+        return IteratorPageSource(elements, per_page)
+
+    if callable(elements):
+        return CallbackPageSource(elements, per_page)
+
+    raise ValueError("Cannot paginate object of type {type}".format(type=type(elements)))
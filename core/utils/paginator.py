@@ -1,21 +1,257 @@
-import math
-from typing import Any
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterable, Iterable
 
 from kgemng import EventManager, NewMessageEvent
 from magic_filter import F
 from pyrogram import errors
 from pyrogram.types import Message
+from RelativeAddonsSystem import Addon
 
-from core import Account
+import config
+from core import Account, addons_loader
+from .page_sources import FetchPage, ListPageSource, PageSource, make_page_source
+from .paginator_storage import PaginatorKey, PaginatorStorage, StoredPageSource
 
 
-def make_pages(elements: list, per_page: int):
-    pages = []
-    pages_count = math.ceil(len(elements) / per_page)
-    for page in range(pages_count):
-        pages.append(elements[page * per_page : page * per_page + per_page])
+class PaginatorService:
+    # Single pager handler and bounded paginators storage, shared by all paginators of parent event manager
+    _services: dict[int, "PaginatorService"] = {}
 
-    return pages
+    # Optional persistent storage, paginators missing in memory are restored from it
+    storage: PaginatorStorage | None = None
+    # Addons with stored paginators, their services are created as soon as event manager is included,
+    # so pager handler works for messages sent before restart
+    _stored_owners: set[str] = set()
+    # Removes expired paginators of all services, otherwise they are removed only when services are used
+    _prune_task: asyncio.Task | None = None
+
+    def __init__(self, parent_event_manager: EventManager, max_entries: int, ttl: float):
+        self._event_manager = EventManager(enabled=True)
+        # (account_id, chat_id, message_id) -> paginator state, ordered from least to most recently used
+        self._paginators: OrderedDict[PaginatorKey, dict[str, Any]] = OrderedDict()
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evicted_count = 0
+
+        self._event_manager.register_message_handler(
+            self.pager_handler, F.message.text.in_(["<", ">"]) & F.message.reply_to_message.is_not(None)
+        )
+        addons_loader.attach_manager(parent_event_manager, self._event_manager)
+        addons_loader.add_manager_finalizer(parent_event_manager, self.close)
+
+        self._parent_event_manager = parent_event_manager
+
+        addon = parent_event_manager.addon
+        self.owner = addon.meta.name if isinstance(addon, Addon) else ""
+
+    @classmethod
+    def get(cls, parent_event_manager: EventManager) -> "PaginatorService":
+        service = cls._services.get(id(parent_event_manager))
+
+        if service is None or service._parent_event_manager is not parent_event_manager:
+            service = cls(parent_event_manager, config.paginator_max_entries, config.paginator_ttl)
+            cls._services[id(parent_event_manager)] = service
+
+        return service
+
+    @classmethod
+    async def open_storage(cls, storage: PaginatorStorage):
+        cls.storage = storage
+        cls._stored_owners = await storage.owners()
+
+        for addon in list(addons_loader.LOADED_ADDONS):
+            try:
+                event_manager = addons_loader.system.get_addon_event_manager(addon)
+            except (AttributeError, ValueError):
+                continue
+
+            cls._restore_service(addon, event_manager)
+
+        addons_loader.add_event_manager_hook(cls._restore_service)
+
+    @classmethod
+    def _restore_service(cls, addon: Addon, event_manager: EventManager):
+        if addon.meta.name in cls._stored_owners:
+            cls.get(event_manager)
+
+    @classmethod
+    def get_services(cls) -> list["PaginatorService"]:
+        return list(cls._services.values())
+
+    @classmethod
+    def start_pruning(cls, interval: float):
+        if cls._prune_task is None:
+            cls._prune_task = asyncio.create_task(cls._prune_loop(interval))
+
+    @classmethod
+    def stop_pruning(cls):
+        if cls._prune_task is not None:
+            cls._prune_task.cancel()
+            cls._prune_task = None
+
+    @classmethod
+    async def _prune_loop(cls, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+
+            for service in cls.get_services():
+                service._evict()
+
+    @property
+    def live_count(self) -> int:
+        return len(self._paginators)
+
+    def _expired(self, paginator: dict[str, Any], now: float) -> bool:
+        return self.ttl > 0 and now - paginator["last_used"] > self.ttl
+
+    def _evict(self):
+        now = time.monotonic()
+
+        # Least recently used paginators are first, so expired ones are removed from the head
+        while len(self._paginators):
+            key, paginator = next(iter(self._paginators.items()))
+
+            if not self._expired(paginator, now) and len(self._paginators) <= self.max_entries:
+                break
+
+            del self._paginators[key]
+            self.evicted_count += 1
+
+    def add(self, key: PaginatorKey, paginator: dict[str, Any]):
+        paginator["last_used"] = time.monotonic()
+
+        self._paginators[key] = paginator
+        self._paginators.move_to_end(key)
+
+        self._evict()
+
+    def get_paginator(self, key: PaginatorKey) -> dict[str, Any] | None:
+        paginator = self._paginators.get(key)
+
+        if paginator is None:
+            return None
+
+        now = time.monotonic()
+
+        if self._expired(paginator, now):
+            del self._paginators[key]
+            self.evicted_count += 1
+            return None
+
+        paginator["last_used"] = now
+        self._paginators.move_to_end(key)
+
+        return paginator
+
+    def clear(self):
+        self._paginators.clear()
+
+    def close(self):
+        # Parent event manager is dropped, its paginators can't be used anymore
+        self.clear()
+        addons_loader.detach_manager(self._parent_event_manager, self._event_manager)
+
+        if self._services.get(id(self._parent_event_manager)) is self:
+            del self._services[id(self._parent_event_manager)]
+
+    def save(self, key: PaginatorKey, paginator: dict[str, Any], *pages: tuple[int, list]):
+        if self.storage is None:
+            return
+
+        self._stored_owners.add(self.owner)
+
+        source: PageSource = paginator["source"]
+
+        self.storage.save_state(
+            self.owner,
+            key,
+            paginator["current_page"],
+            source.last_page,
+            paginator["allow_to_use_by_others"],
+            paginator["paginator"].settings,
+        )
+
+        if isinstance(source, StoredPageSource):
+            return
+
+        for page, elements in pages:
+            self.storage.save_page(key, page, elements)
+
+    async def restore(self, key: PaginatorKey) -> dict[str, Any] | None:
+        if self.storage is None:
+            return None
+
+        state = await self.storage.load_state(self.owner, key)
+
+        if state is None:
+            return None
+
+        paginator = Paginator(self._parent_event_manager)
+
+        for name, value in state["settings"].items():
+            setattr(paginator, name, value)
+
+        restored = {
+            "paginator": paginator,
+            "source": StoredPageSource(self.storage, key, None, state["last_page"]),
+            "current_page": state["current_page"],
+            "message_id": key[2],
+            "chat_id": key[1],
+            "allow_to_use_by_others": state["allow_to_use_by_others"],
+            "account_id": key[0],
+        }
+        self.add(key, restored)
+
+        return restored
+
+    async def pager_handler(self, event: NewMessageEvent):
+        increase_page_number = event.message.text == ">"
+
+        key = (event.account.info.id, event.message.chat.id, event.message.reply_to_message.id)
+        paginator = self.get_paginator(key)
+
+        if paginator is None:
+            paginator = await self.restore(key)
+
+        if paginator is None:
+            return event.skip()
+
+        if not paginator["allow_to_use_by_others"] and not event.message.outgoing:
+            return event.skip()
+
+        page = paginator["current_page"] + (1 if increase_page_number else -1)
+
+        source: PageSource = paginator["source"]
+        elements, has_next_page = await source.open_page(page)
+
+        if elements is None:
+            return await event.account.edit_message_text(
+                event.message.chat.id, event.message.id, "No one page left"
+            )
+
+        paginator["current_page"] = page
+
+        pages = [(page, elements)]
+
+        if has_next_page and self.storage is not None:
+            # Next page is saved too, so the next page link works after restart
+            pages.append((page + 1, await source.get_page(page + 1)))
+
+        self.save(key, paginator, *pages)
+
+        await event.account.edit_message_text(
+            chat_id=paginator["chat_id"],
+            message_id=paginator["message_id"],
+            text=paginator["paginator"]._page_text(elements, page, has_next_page)
+        )
+
+        try:
+            await event.message.delete()
+        except errors.MessageDeleteForbidden:
+            pass
 
 
 class Paginator:
@@ -23,15 +259,7 @@ class Paginator:
     _account: Account | None = None
 
     def __init__(self, event_manager: EventManager):
-        self._event_manager = EventManager(enabled=True)
-        self._paginators: dict[int, dict[str, Any]] = {}
-        self._paginators_messages: dict[int, int] = {}
-        self._last_paginator_id = -1
-
-        self._event_manager.register_message_handler(
-            self.pager_handler, F.message.text.in_(["<", ">"]) & F.message.reply_to_message.is_not(None)
-        )
-        event_manager.include_manager(self._event_manager)
+        self._service = PaginatorService.get(event_manager)
 
         self._parent_event_manager = event_manager
 
@@ -53,18 +281,29 @@ class Paginator:
         self.page_element_suffix = ""
 
     @property
-    def paginator_id(self):
-        self._last_paginator_id += 1
-        return self._last_paginator_id
+    def service(self) -> PaginatorService:
+        return self._service
 
-    def _page_text(self, pages: list[str], page):
+    @property
+    def settings(self) -> dict[str, str]:
+        return {
+            "header": self.header,
+            "footer": self.footer,
+            "previous_page": self.previous_page,
+            "next_page": self.next_page,
+            "page_element_separator": self.page_element_separator,
+            "page_element_prefix": self.page_element_prefix,
+            "page_element_suffix": self.page_element_suffix,
+        }
+
+    def _page_text(self, elements: list[str], page: int, has_next_page: bool):
         return (
             self.header + "\n\n"
             + self.page_element_separator.join(
                 "{0}{1}{2}".format(
                     self.page_element_prefix, element, self.page_element_suffix
                 )
-                for element in pages[page - 1]
+                for element in elements
             )
             + "\n\n"
             + self.footer.format(
@@ -73,7 +312,7 @@ class Paginator:
                 else "",
                 page=page,
                 next_page=self.next_page.format(page=page + 1)
-                if page != len(pages)
+                if has_next_page
                 else "",
             ).strip()
         )
@@ -88,66 +327,56 @@ class Paginator:
 
         return self
 
-    async def make(self, elements: list[str], per_page: int = ...):
+    async def make(
+        self,
+        elements: list[str] | Iterable[str] | AsyncIterable[str] | FetchPage | PageSource,
+        per_page: int = ...
+    ):
+        # Elements may be a list, sync or async iterator, or callback fetch_page(page, per_page) -> elements,
+        # pages of iterators and callbacks are fetched only when user flips to them
         if not self._ready:
             raise ReferenceError("Paginator not ready to making pages. Use Paginator.init first")
-        paginator_id = self.paginator_id
-        pages = make_pages(elements, per_page)
+        source = make_page_source(elements, per_page)
+        elements, has_next_page = await source.open_page(1)
 
         if self._edit:
-            sent = await self._account.client.edit_message_text(
+            sent = await self._account.edit_message_text(
                 chat_id=self._chat_id,
                 message_id=self._message_id,
-                text=self._page_text(pages, 1),
+                text=self._page_text(elements, 1, has_next_page),
             )
         else:
-            sent = await self._account.client.send_message(
+            sent = await self._account.send_message(
                 chat_id=self._chat_id,
                 reply_to_message_id=self._message_id,
-                text=self._page_text(pages, 1),
+                text=self._page_text(elements, 1, has_next_page),
             )
 
-        self._paginators[paginator_id] = {
-            "pages": pages,
+        key = (self._account.info.id, self._chat_id, sent.id)
+        paginator = {
+            "paginator": self,
+            "source": source,
             "current_page": 1,
             "message_id": sent.id,
             "chat_id": self._chat_id,
             "allow_to_use_by_others": self._allow_to_use_by_others,
             "account_id": self._account.info.id,
         }
-        self._paginators_messages[sent.id] = paginator_id
 
-    async def pager_handler(self, event: NewMessageEvent):
-        increase_page_number = event.message.text == ">"
-
-        if event.message.reply_to_message.id not in self._paginators_messages:
-            return event.skip()
+        storage = self._service.storage
 
-        paginator = self._paginators[
-            self._paginators_messages[event.message.reply_to_message.id]
-        ]
+        if storage is not None and isinstance(source, ListPageSource):
+            # List pages are moved to storage, so only hot pages stay in memory
+            self._service.save(
+                key, paginator, *[(page, await source.get_page(page)) for page in range(1, source.last_page + 1)]
+            )
+            paginator["source"] = StoredPageSource(storage, key, per_page, source.last_page)
+        elif storage is not None:
+            pages = [(1, elements)]
 
-        if not paginator["allow_to_use_by_others"] and not event.message.outgoing:
-            return event.skip()
+            if has_next_page:
+                pages.append((2, await source.get_page(2)))
 
-        if (
-            increase_page_number
-            and len(paginator["pages"]) == paginator["current_page"]
-        ) or (not increase_page_number and paginator["current_page"] == 1):
-            return await event.message.edit("No one page left")
+            self._service.save(key, paginator, *pages)
 
-        if increase_page_number:
-            paginator["current_page"] += 1
-        else:
-            paginator["current_page"] -= 1
-
-        await event.account.client.edit_message_text(
-            chat_id=paginator["chat_id"],
-            message_id=paginator["message_id"],
-            text=self._page_text(paginator["pages"], paginator["current_page"])
-        )
-
-        try:
-            await event.message.delete()
-        except errors.MessageDeleteForbidden:
-            pass
+        self._service.add(key, paginator)
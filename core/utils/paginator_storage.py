@@ -0,0 +1,219 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any
+
+import aiosqlite
+from colorama import Fore
+
+from core.logs import get_logger, wrap_into_color
+from .page_sources import PageSource
+
+logger = get_logger("PaginatorStorage")
+
+PaginatorKey = tuple[int, int, int]
+
+
+class PaginatorStorage:
+    # Paginators state and pages content in local SQLite database, writes are buffered and flushed in batches
+
+    def __init__(self, connection: aiosqlite.Connection, ttl: float, flush_interval: float, batch_size: int):
+        self._connection = connection
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._pending_states: dict[PaginatorKey, tuple] = {}
+        self._pending_pages: dict[tuple[PaginatorKey, int], str] = {}
+        self._flush_requested = asyncio.Event()
+        self._last_purge = 0.0
+
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    @classmethod
+    async def open(
+        cls,
+        path: str | Path,
+        ttl: float = 0,
+        flush_interval: float = 1.0,
+        batch_size: int = 100
+    ) -> "PaginatorStorage":
+        connection = await aiosqlite.connect(str(path))
+
+        await connection.execute("PRAGMA journal_mode=WAL")
+        await connection.execute("PRAGMA synchronous=NORMAL")
+        await connection.execute(
+            "CREATE TABLE IF NOT EXISTS paginators ("
+            "owner TEXT NOT NULL, "
+            "account_id INTEGER NOT NULL, "
+            "chat_id INTEGER NOT NULL, "
+            "message_id INTEGER NOT NULL, "
+            "current_page INTEGER NOT NULL, "
+            "last_page INTEGER, "
+            "allow_to_use_by_others INTEGER NOT NULL, "
+            "settings TEXT NOT NULL, "
+            "updated_at REAL NOT NULL, "
+            "PRIMARY KEY (account_id, chat_id, message_id))"
+        )
+        await connection.execute(
+            "CREATE TABLE IF NOT EXISTS paginator_pages ("
+            "account_id INTEGER NOT NULL, "
+            "chat_id INTEGER NOT NULL, "
+            "message_id INTEGER NOT NULL, "
+            "page INTEGER NOT NULL, "
+            "elements TEXT NOT NULL, "
+            "PRIMARY KEY (account_id, chat_id, message_id, page))"
+        )
+        await connection.commit()
+
+        storage = cls(connection, ttl, flush_interval, batch_size)
+        await storage.purge()
+
+        return storage
+
+    def _request_flush(self):
+        if len(self._pending_states) + len(self._pending_pages) >= self.batch_size:
+            self._flush_requested.set()
+
+    def save_state(
+        self,
+        owner: str,
+        key: PaginatorKey,
+        current_page: int,
+        last_page: int | None,
+        allow_to_use_by_others: bool,
+        settings: dict[str, Any]
+    ):
+        self._pending_states[key] = (
+            owner, *key, current_page, last_page, int(bool(allow_to_use_by_others)),
+            json.dumps(settings, ensure_ascii=False), time.time()
+        )
+        self._request_flush()
+
+    def save_page(self, key: PaginatorKey, page: int, elements: list):
+        self._pending_pages[(key, page)] = json.dumps([str(element) for element in elements], ensure_ascii=False)
+        self._request_flush()
+
+    async def load_state(self, owner: str, key: PaginatorKey) -> dict[str, Any] | None:
+        row = self._pending_states.get(key)
+
+        if row is None:
+            async with self._connection.execute(
+                "SELECT owner, account_id, chat_id, message_id, current_page, last_page, "
+                "allow_to_use_by_others, settings, updated_at "
+                "FROM paginators WHERE account_id = ? AND chat_id = ? AND message_id = ?",
+                key
+            ) as cursor:
+                row = await cursor.fetchone()
+
+        if row is None or row[0] != owner or self._expired(row[8]):
+            return None
+
+        return {
+            "current_page": row[4],
+            "last_page": row[5],
+            "allow_to_use_by_others": bool(row[6]),
+            "settings": json.loads(row[7]),
+        }
+
+    async def owners(self) -> set[str]:
+        # Addons that have stored paginators
+        async with self._connection.execute(
+            "SELECT DISTINCT owner FROM paginators WHERE updated_at >= ?",
+            (time.time() - self.ttl if self.ttl > 0 else 0,)
+        ) as cursor:
+            owners = {row[0] for row in await cursor.fetchall()}
+
+        return owners | {state[0] for state in self._pending_states.values()}
+
+    async def load_page(self, key: PaginatorKey, page: int) -> list[str] | None:
+        elements = self._pending_pages.get((key, page))
+
+        if elements is None:
+            async with self._connection.execute(
+                "SELECT elements FROM paginator_pages "
+                "WHERE account_id = ? AND chat_id = ? AND message_id = ? AND page = ?",
+                (*key, page)
+            ) as cursor:
+                row = await cursor.fetchone()
+
+            if row is None:
+                return None
+
+            elements = row[0]
+
+        return json.loads(elements)
+
+    def _expired(self, updated_at: float) -> bool:
+        return self.ttl > 0 and time.time() - updated_at > self.ttl
+
+    async def purge(self):
+        self._last_purge = time.monotonic()
+
+        if self.ttl <= 0:
+            return
+
+        await self._connection.execute(
+            "DELETE FROM paginator_pages WHERE (account_id, chat_id, message_id) IN ("
+            "SELECT account_id, chat_id, message_id FROM paginators WHERE updated_at < ?)",
+            (time.time() - self.ttl,)
+        )
+        await self._connection.execute("DELETE FROM paginators WHERE updated_at < ?", (time.time() - self.ttl,))
+        await self._connection.commit()
+
+    async def flush(self):
+        if not len(self._pending_states) and not len(self._pending_pages):
+            return
+
+        states, self._pending_states = self._pending_states, {}
+        pages, self._pending_pages = self._pending_pages, {}
+
+        await self._connection.executemany(
+            "INSERT OR REPLACE INTO paginators VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            states.values()
+        )
+        await self._connection.executemany(
+            "INSERT OR REPLACE INTO paginator_pages VALUES (?, ?, ?, ?, ?)",
+            ((*key, page, elements) for (key, page), elements in pages.items())
+        )
+        await self._connection.commit()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._flush_requested.clear()
+
+            try:
+                await self.flush()
+
+                if time.monotonic() - self._last_purge > 3600:
+                    await self.purge()
+            except Exception as e:
+                logger.warning("Error while writing paginators -> " + wrap_into_color(repr(e), color=Fore.RED))
+
+    async def close(self):
+        self._flush_task.cancel()
+
+        try:
+            await self._flush_task
+        except asyncio.CancelledError:
+            pass
+
+        await self.flush()
+        await self._connection.close()
+
+
+class StoredPageSource(PageSource):
+    def __init__(self, storage: PaginatorStorage, key: PaginatorKey, per_page: int | None, last_page: int | None):
+        super().__init__(per_page)
+        self._storage = storage
+        self._key = key
+        self._last_page = last_page
+
+    async def _fetch(self, page: int) -> list | None:
+        return await self._storage.load_page(self._key, page)
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from types import FrameType
+from typing import Callable, Iterable
+
+from RelativeAddonsSystem import Addon
+from colorama import Fore
+
+from core.logs import get_logger, wrap_into_color
+from core.perf import LatencyHistogram
+from core.statistics import TopCounter
+
+logger = get_logger("Watchdog", logging.INFO)
+
+UNKNOWN = "unknown"
+
+StallKey = tuple[str, str]
+
+
+class StallDetector:
+    # Heartbeat on the event loop measures its lag, while watchdog thread captures stack of blocked loop thread
+
+    def __init__(self, addons: Callable[[], Iterable[Addon]], threshold: float = 0.5, interval: float = 0.1):
+        self.threshold = threshold
+        self.interval = interval
+
+        self._addons = addons
+
+        self.lag = LatencyHistogram()
+        self.stalls = 0
+        # (addon name, handler name) -> stalls count and longest stall
+        self.offenders = TopCounter(10)
+        self.longest: dict[StallKey, float] = {}
+
+        self._beat: float | None = None
+        self._capture: tuple[float, StallKey, str] | None = None
+        self._loop_thread_id: int | None = None
+
+        self._heartbeat_task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    def attribute(self, frame: FrameType | None) -> StallKey:
+        directories = {
+            str(addon.path) + os.sep: addon.meta.name
+            for addon in self._addons()
+        }
+
+        # Innermost frame from addon directory is handler (or helper) that blocks the loop
+        while frame is not None:
+            filename = os.path.abspath(frame.f_code.co_filename)
+
+            for directory, name in directories.items():
+                if filename.startswith(directory):
+                    return name, getattr(frame.f_code, "co_qualname", frame.f_code.co_name)
+
+            frame = frame.f_back
+
+        return UNKNOWN, UNKNOWN
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval / 2):
+            beat = self._beat
+
+            if beat is None or time.monotonic() - beat <= self.interval + self.threshold:
+                continue
+
+            if self._capture is not None and self._capture[0] == beat:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+
+            try:
+                self._capture = (beat, self.attribute(frame), "".join(traceback.format_stack(frame, limit=10)))
+            finally:
+                del frame
+
+    async def _heartbeat(self):
+        while True:
+            beat = self._beat = time.monotonic()
+
+            await asyncio.sleep(self.interval)
+
+            lag = max(time.monotonic() - beat - self.interval, 0)
+            self.lag.record(lag)
+
+            if lag > self.threshold:
+                self._stalled(beat, lag)
+
+    def _stalled(self, beat: float, lag: float):
+        key, stack = (UNKNOWN, UNKNOWN), ""
+
+        if self._capture is not None and self._capture[0] == beat:
+            _, key, stack = self._capture
+
+        self.stalls += 1
+        self.offenders.increment(key)
+        self.longest[key] = max(self.longest.get(key, 0.0), lag)
+
+        logger.warning(
+            "Event loop was blocked for {lag} by [ {addon} ] {handler}".format(
+                lag=wrap_into_color(f"{lag * 1000:.0f}ms", color=Fore.RED),
+                addon=wrap_into_color(key[0], color=Fore.YELLOW),
+                handler=wrap_into_color(key[1], color=Fore.YELLOW)
+            )
+            + ("\n" + stack if stack else "")
+        )
+
+    def get_offenders(self, n: int | None = None) -> list[tuple[StallKey, int, float]]:
+        return [(key, count, self.longest[key]) for key, count in self.offenders.top(n)]
+
+    def start(self):
+        if self._heartbeat_task is not None:
+            return
+
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="EventLoopWatchdog", daemon=True)
+        self._thread.start()
+
+        logger.info(
+            "Watching event loop for stalls longer than {threshold}".format(
+                threshold=wrap_into_color(f"{self.threshold * 1000:.0f}ms", color=Fore.YELLOW)
+            )
+        )
+
+    def stop(self):
+        if self._heartbeat_task is None:
+            return
+
+        self._heartbeat_task.cancel()
+        self._heartbeat_task = None
+
+        self._stopped.set()
+        self._thread = None
+        self._beat = None
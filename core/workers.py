@@ -0,0 +1,194 @@
+import asyncio
+import builtins
+import functools
+import importlib.abc
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable
+
+from colorama import Fore
+from RelativeAddonsSystem import Addon
+
+import config
+from core.logs import get_logger, wrap_into_color
+from core.perf import LatencyHistogram
+
+logger = get_logger("ProcessPool", logging.INFO)
+
+
+def function_name(function: Callable) -> str:
+    return getattr(function, "__module__", "") + "." + getattr(function, "__qualname__", repr(function))
+
+
+class AddonModulesFinder(importlib.abc.MetaPathFinder):
+    # Workers import addon modules by themselves when unpickling their functions, and addon modules expect
+    # builtins.this to be set while they are imported, the same way addons loader does it
+    def __init__(self, addons_root: str):
+        self.addons_root = Path(addons_root).resolve()
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+
+            spec = finder.find_spec(name, path, target)
+
+            if spec is not None:
+                break
+        else:
+            return None
+
+        if spec.origin is None or spec.loader is None:
+            return spec
+
+        origin = Path(spec.origin).resolve()
+
+        if not origin.is_relative_to(self.addons_root) or origin.parent == self.addons_root:
+            return spec
+
+        addon_path = self.addons_root / origin.relative_to(self.addons_root).parts[0]
+        exec_module = spec.loader.exec_module
+
+        def exec_addon_module(module):
+            previous = builtins.__dict__.get("this")
+            setattr(builtins, "this", Addon(addon_path))
+
+            try:
+                exec_module(module)
+            finally:
+                if previous is None:
+                    delattr(builtins, "this")
+                else:
+                    setattr(builtins, "this", previous)
+
+        spec.loader.exec_module = exec_addon_module
+
+        return spec
+
+
+def init_worker(addons_root: str):
+    sys.meta_path.insert(0, AddonModulesFinder(addons_root))
+
+
+class ProcessPool:
+    # Shared pool of worker processes for CPU-heavy work of addons, functions and arguments must be picklable
+
+    def __init__(self, workers: int):
+        self.workers = workers or os.cpu_count() or 1
+
+        self._executor: ProcessPoolExecutor | None = None
+
+        self.pending = 0
+        self.max_pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+        self.latencies: dict[str, LatencyHistogram] = {}
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Forking this process isn't safe, it has running threads (logs listener, watchdog, shards connection).
+            # Workers are forked from a single-threaded fork server, import main.py as __mp_main__
+            # and import modules of pickled functions by themselves
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else None)
+
+            if context.get_start_method() == "forkserver":
+                context.set_forkserver_preload([])
+
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=context, initializer=init_worker, initargs=(str(config.addons_root),)
+            )
+
+            logger.info(
+                "Started process pool with {workers} workers".format(
+                    workers=wrap_into_color(str(self.workers), color=Fore.YELLOW)
+                )
+            )
+
+        return self._executor
+
+    @property
+    def queued(self) -> int:
+        # Calls waiting for free worker
+        return max(self.pending - self.workers, 0)
+
+    def get_latency(self, name: str) -> LatencyHistogram:
+        histogram = self.latencies.get(name)
+
+        if histogram is None:
+            histogram = self.latencies[name] = LatencyHistogram()
+
+        return histogram
+
+    async def run(self, function: Callable, *args, timeout: float | None = None, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        name = function_name(function)
+
+        # Cancelling a call removes it from the queue, calls that already started are finished by worker
+        future = loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        started_at = loop.time()
+
+        try:
+            result = await asyncio.wait_for(future, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            self.cancelled += 1
+            raise
+        except BrokenProcessPool:
+            self.failed += 1
+            self.get_latency(name).errors += 1
+
+            # Worker died (killed or crashed interpreter), next calls will start a new pool
+            logger.warning(
+                "Process pool is broken by [ {name} ], restarting it".format(
+                    name=wrap_into_color(name, color=Fore.YELLOW)
+                )
+            )
+            self.shutdown(wait=False)
+            raise
+        except Exception:
+            self.failed += 1
+            self.get_latency(name).errors += 1
+            raise
+        else:
+            self.completed += 1
+            return result
+        finally:
+            self.pending -= 1
+            self.get_latency(name).record(loop.time() - started_at)
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is None:
+            return
+
+        executor, self._executor = self._executor, None
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+PROCESS_POOL = ProcessPool(config.process_pool_workers)
+
+
+async def run_in_process(function: Callable, *args, timeout: float | None = None, **kwargs) -> Any:
+    return await PROCESS_POOL.run(function, *args, timeout=timeout, **kwargs)
+
+
+def cpu_bound(function: Callable) -> Callable:
+    # Marks module-level function to be run in process pool: calling it returns awaitable result
+    @functools.wraps(function)
+    async def wrapper(*args, timeout: float | None = None, **kwargs):
+        return await PROCESS_POOL.run(function, *args, timeout=timeout, **kwargs)
+
+    # Module attribute now points to wrapper, so original function is pickled by reference through it
+    function.__qualname__ += ".__wrapped__"
+
+    return wrapper
@@ -1,5 +1,8 @@
+import argparse
 import asyncio
+import time
 from logging import INFO
+from pathlib import Path
 
 from pyrogram import Client, filters, errors
 from kgemng import EventManager, CommandManager
@@ -9,14 +12,17 @@ from colorama import Fore
 from core import MainAddon
 from core import exceptions, Account, AccountManager
 from core.addons_loader import load_main_addon, system, load_addons
-from core import addons_loader
+from core import addons_loader, sharding
 from core.logs import get_logger, wrap_into_color
+from core.utils import PaginatorService, PaginatorStorage
+from core.workers import PROCESS_POOL
 
 import config
 
 logger = get_logger("StartupService", INFO)
 
-if __name__ != "__main__":
+# Worker processes of process pool import this file as __mp_main__, it must not start anything there
+if __name__ not in ("__main__", "__mp_main__"):
     raise exceptions.StartupError(
         "This python code file must be opened via interpreter"
     )
@@ -24,18 +30,152 @@ if __name__ != "__main__":
 
 def error_handler(exception, context):
     error_handler_logger = get_logger("MainErrorHandler")
+    addons_loader.PERFORMANCE.record_error()
+
     if isinstance(exception, errors.FloodWait):
+        # Requests made through Account.outbound are sent again, others are lost
+        error_handler_logger.warning(
+            "FloodWait for {seconds}s is not handled, request is dropped. Context: {context}".format(
+                seconds=exception.value, context=context
+            )
+        )
         return
 
     error_handler_logger.warning(f"Error occurred {exception}. Context: {context}")
 
 
-async def main():
+def full_name(user) -> str:
+    return user.first_name + (" " + user.last_name if user.last_name else "")
+
+
+def is_authorized(account: Account) -> bool:
+    client = account.client
+    return client.in_memory or (Path(client.workdir) / (client.name + ".session")).exists()
+
+
+async def start_account(account: Account, semaphore: asyncio.Semaphore, timeout: float | None) -> dict:
+    client = account.client
+    report = dict(name=Path(client.name).name, connect=None, get_me=None, error=None)
+
+    # Sessions without authorization prompt for phone code and can't be limited by timeout
+    if not is_authorized(account):
+        timeout = None
+
+    async with semaphore:
+        try:
+            started_at = time.perf_counter()
+            await asyncio.wait_for(client.start(), timeout)
+            report["connect"] = time.perf_counter() - started_at
+
+            started_at = time.perf_counter()
+            account_info = await asyncio.wait_for(account.resolve_info(), timeout)
+            report["get_me"] = time.perf_counter() - started_at
+        except Exception as e:
+            report["error"] = "timed out" if isinstance(e, asyncio.TimeoutError) else repr(e)
+
+            try:
+                if client.is_initialized:
+                    await client.stop()
+                elif client.is_connected:
+                    await client.disconnect()
+            except Exception:
+                pass
+
+            return report
+
+    logger.info(
+        "Account [ {name} ] has been loaded!".format(
+            name=wrap_into_color(full_name(account_info), color=Fore.YELLOW)
+        )
+    )
+
+    return report
+
+
+async def start_accounts(account_manager: AccountManager):
+    semaphore = asyncio.Semaphore(max(config.startup_concurrency, 1))
+    timeout = config.startup_connect_timeout or None
+
+    accounts = account_manager.get_accounts()
+
+    started_at = time.perf_counter()
+
+    # Sessions without authorization share stdin for phone and code prompts, so they are started one by one
+    reports = {}
+    for account in accounts:
+        if not is_authorized(account):
+            reports[account] = await start_account(account, semaphore, timeout)
+
+    authorized = [account for account in accounts if account not in reports]
+    reports.update(zip(
+        authorized,
+        await asyncio.gather(*(start_account(account, semaphore, timeout) for account in authorized))
+    ))
+
+    total = time.perf_counter() - started_at
+
+    def milliseconds(value: float | None) -> str:
+        return f"{value * 1000:.0f}ms" if value is not None else "-"
+
+    lines = []
+    for account in accounts:
+        report = reports[account]
+        if report["error"]:
+            account_manager.remove_account(account)
+            lines.append(
+                f"{report['name']}: "
+                + wrap_into_color(f"failed ({report['error']})", color=Fore.RED)
+            )
+            continue
+
+        lines.append(
+            f"{report['name']}: connect {milliseconds(report['connect'])}, get_me {milliseconds(report['get_me'])}"
+        )
+
+    logger.info(
+        "Accounts startup report ({loaded}/{count} loaded in {total}):\n    ".format(
+            loaded=len(account_manager.get_accounts()),
+            count=len(accounts),
+            total=milliseconds(total)
+        )
+        + "\n    ".join(lines)
+    )
+
+    if not len(account_manager.get_accounts()):
+        raise exceptions.StartupError("No one account has been loaded")
+
+
+def shards_count() -> int:
+    return max(min(config.shards, config.accounts_count), 1)
+
+
+async def supervise():
+    # Addons index and dependencies are shared by shards, so they are updated once here before shards start
+    enabled_addons = system.get_enabled_addons()
+
+    if system.auto_install_dependencies:
+        await system.install_dependencies(enabled_addons)
+
+    supervisor = sharding.ShardSupervisor(
+        shards_count(), [str(Path(__file__).absolute())], config.shards_health_interval
+    )
+
+    await supervisor.run()
+
+
+async def main(shard: int | None = None):
 
-    logger.info("{name} starting...".format(name=wrap_into_color(config.name, color=Fore.YELLOW)))
+    logger.info(
+        "{name} starting{shard}...".format(
+            name=wrap_into_color(config.name, color=Fore.YELLOW),
+            shard=f" shard {shard}" if shard is not None else ""
+        )
+    )
 
     account_manager = AccountManager()
 
+    sharding.set_account_manager(account_manager)
+
     addons_loader.system.set_main_addon(MainAddon.this_addon)
 
     command_manager = CommandManager(CommandManager.NO_ADDON, True)
@@ -48,7 +188,7 @@ async def main():
 
     addons_loader.init(command_manager, event_manager)
 
-    for index in range(1, config.accounts_count + 1):
+    for index in sharding.shard_accounts(config.accounts_count, shard, shards_count()):
         name = "account"
         if index > 1:
             name += f"-{index}"
@@ -72,28 +212,80 @@ async def main():
 
         client.account = account
 
-        client.add_handler(MessageHandler(command_manager.execute, filters.text))
-        client.add_handler(RawUpdateHandler(event_manager.execute))
-
-    load_main_addon()
-    load_addons(*system.get_enabled_addons())
-
-    for account in account_manager.get_accounts():
-        await account.client.start()
-        account_info = await account.resolve_info()
-        logger.info(
-            "Account [ {name} ] has been loaded!".format(
-                name=wrap_into_color(
-                    f"{account_info.first_name}"
-                    + (" " + account_info.last_name if account_info.last_name else ""),
-                    color=Fore.YELLOW
-                )
-            )
+        client.add_handler(MessageHandler(addons_loader.execute_command, filters.text))
+        client.add_handler(RawUpdateHandler(addons_loader.execute_event))
+
+    if shard is not None:
+        await sharding.connect(
+            shard,
+            lambda: {
+                "accounts": len(account_manager.get_accounts()),
+                # Totals loaded from shared storage are the same in every shard, so they aren't summed
+                "commands": addons_loader.STATISTICS.recorded,
+                "stalls": addons_loader.STALL_DETECTOR.stalls,
+                "pool_pending": PROCESS_POOL.pending,
+            },
+            config.shards_health_interval
+        )
+
+    enabled_addons = system.get_enabled_addons()
+
+    if system.auto_install_dependencies:
+        await system.install_dependencies(enabled_addons, install=shard is None)
+
+    await load_main_addon()
+    await load_addons(*enabled_addons)
+
+    if config.paginator_storage:
+        await PaginatorService.open_storage(
+            await PaginatorStorage.open(config.paginator_storage, config.paginator_ttl)
         )
 
+    if config.paginator_ttl > 0:
+        PaginatorService.start_pruning(config.paginator_prune_interval)
+
+    if config.statistics_storage:
+        await addons_loader.STATISTICS.open(config.statistics_storage, config.statistics_flush_interval)
+
+    await start_accounts(account_manager)
+
+    if config.watchdog_enabled:
+        addons_loader.STALL_DETECTOR.start()
+
+    watcher = None
+
+    if config.addons_hot_reload:
+        watcher = asyncio.create_task(addons_loader.watch_addons(config.addons_hot_reload_interval))
+
     logger.info("{name} started and waiting for updates!".format(name=wrap_into_color(config.name, color=Fore.YELLOW)))
-    while 1:
-        await asyncio.sleep(1800)
+    try:
+        while 1:
+            await asyncio.sleep(1800)
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+
+        addons_loader.STALL_DETECTOR.stop()
+        addons_loader.INTAKE.stop()
+        PaginatorService.stop_pruning()
+
+        if PaginatorService.storage is not None:
+            await PaginatorService.storage.close()
+
+        await addons_loader.STATISTICS.close()
+
+        PROCESS_POOL.shutdown(wait=False)
+
+        if sharding.CONNECTION is not None:
+            sharding.CONNECTION.close()
+
 
+if __name__ == "__main__":
+    arguments_parser = argparse.ArgumentParser(description=config.name)
+    arguments_parser.add_argument("--shard", type=int, default=None, help="Run as worker of shards supervisor")
+    arguments = arguments_parser.parse_args()
 
-asyncio.run(main())
+    if arguments.shard is None and shards_count() > 1:
+        asyncio.run(supervise())
+    else:
+        asyncio.run(main(arguments.shard))